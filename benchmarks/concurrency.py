@@ -0,0 +1,80 @@
+""" Throughput benchmark of concurrent sales on one candy machine
+
+The lost update and overselling checks are in tests/test_concurrency.py.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+# Let the benchmark run from the repository or from this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from candy_machine import Candy_Machine
+
+
+def use_global_lock(candy_machine):
+    """ Make every dispenser and the register share one lock, for comparison """
+    lock = threading.RLock()
+    candy_machine.cash_register.lock = lock
+    for dispenser in candy_machine.item_key.values():
+        dispenser.lock = lock
+
+
+def run(threads, sales, stock, global_lock=False):
+    """ Sell from many threads at once, return the machine and the sales made per thread """
+    candy_machine = Candy_Machine()
+    for dispenser in candy_machine.item_key.values():
+        dispenser.number_of_items = stock
+    if global_lock:
+        use_global_lock(candy_machine)
+
+    items = list(candy_machine.item_key)
+    sold = [0] * threads
+    start = threading.Barrier(threads + 1)
+
+    def customer(number):
+        # Each thread keeps to one item so per dispenser locks only contend within an item
+        session = candy_machine.open_session()
+        session.select(items[number % len(items)])
+        start.wait()
+        for _ in range(sales):
+            if session.sell_product(50):
+                sold[number] += 1
+
+    workers = [threading.Thread(target=customer, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return candy_machine, sold, time.perf_counter() - began
+
+
+def check(candy_machine, sold, stock):
+    """ Ensure no sale was lost or sold twice, so a fast run is not a broken one """
+    total_sold = sum(sold)
+    remaining = sum(dispenser.get_count() for dispenser in candy_machine.item_key.values())
+    assert remaining + total_sold == stock * len(candy_machine.item_key), "stock does not add up"
+    assert candy_machine.cash_register.current_balance() == 500 + 50 * total_sold, "cash does not add up"
+    assert all(dispenser.get_count() >= 0 for dispenser in candy_machine.item_key.values()), "item oversold"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent sales.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--sales", type=int, default=20000, help="sales attempted by each thread")
+    args = parser.parse_args()
+
+    # Enough stock for every attempt
+    stock = args.threads * args.sales
+    for name, global_lock in (("per dispenser locks", False), ("single global lock", True)):
+        candy_machine, sold, seconds = run(args.threads, args.sales, stock, global_lock)
+        check(candy_machine, sold, stock)
+        print(f"{name}: {sum(sold) / seconds:,.0f} sales/sec")
+
+
+if __name__ == "__main__":
+    main()
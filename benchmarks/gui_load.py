@@ -0,0 +1,228 @@
+""" Drive the Tk app with a scripted or recorded stream of customer and admin events
+
+    python benchmarks/gui_load.py --xvfb --rate 50 --seconds 600
+    python benchmarks/gui_load.py --save-events events.jsonl --seconds 60
+    python benchmarks/gui_load.py --replay events.jsonl
+
+Events are sent through App.controller the way the buttons send them.
+Questions that would open a modal dialog are answered yes. Every report
+interval it prints the event loop lag (how late scheduled events and a
+10 ms heartbeat ran), the time to switch frames, the traced memory and the
+number of widgets, so leaks such as frames built again on every refresh
+show up as steady growth.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from run import load_app_module
+
+# Share of each kind of event in a scripted stream
+EVENT_WEIGHTS = {"buy": 80, "cancel": 10, "edit_item": 7, "edit_balance": 3}
+
+
+def scripted_events(rng, items, rate, seconds):
+    """ Events at the given rate, as dicts with the time in seconds from the start """
+    kinds = list(EVENT_WEIGHTS)
+    weights = list(EVENT_WEIGHTS.values())
+    for number in range(int(rate * seconds)):
+        kind = rng.choices(kinds, weights)[0]
+        event = {"at": number / rate, "kind": kind, "item": rng.choice(items)}
+        if kind == "buy":
+            event["deposit"] = rng.choice((50, 60, 70, 100))
+        elif kind == "cancel":
+            event["deposit"] = 10
+        elif kind == "edit_item":
+            event["cost"] = rng.choice((40, 50, 60))
+            event["number_of_items"] = rng.randint(50, 200)
+        else:
+            event["balance"] = rng.randint(500, 5000)
+        yield event
+
+
+def answer_yes(name):
+    """ Stand-in for a messagebox question, keeping its name so the app still treats it as a question """
+    def question(*args, **kwargs):
+        return True
+    question.__name__ = name
+    return question
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def start_xvfb():
+    """ Start a virtual display and point tk at it, returns the process """
+    if shutil.which("Xvfb") is None:
+        sys.exit("Xvfb is not installed")
+    display = f":{90 + os.getpid() % 100}"
+    process = subprocess.Popen(["Xvfb", display, "-screen", "0", "1280x800x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = display
+    time.sleep(0.5)
+    return process
+
+
+def percentile(ordered, fraction):
+    """ Value below which the given fraction of the sorted values fall """
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class Harness():
+    """ Sends the events to the app at their times and measures how it keeps up """
+    def __init__(self, app_module, app, events, report_every):
+        self.app_module = app_module
+        self.app = app
+        self.events = events
+        self.report_every = report_every
+        self.next_event = 0
+        self.done = 0
+        self.lags = []
+        self.switches = []
+        self.began = None
+        self.reported = None
+        self.first_memory = None
+
+        # Time each frame switch until the frame is drawn
+        show_frame = app.show_frame
+
+        def timed_show_frame(page):
+            began = time.perf_counter()
+            show_frame(page)
+            app.update_idletasks()
+            self.switches.append(time.perf_counter() - began)
+        app.show_frame = timed_show_frame
+
+    def run(self):
+        tracemalloc.start()
+        self.began = self.reported = time.perf_counter()
+        self.first_memory = tracemalloc.get_traced_memory()[0]
+        self.app.after(0, self.send_due)
+        self.app.after(10, self.heartbeat, time.perf_counter() + 0.01)
+        self.app.mainloop()
+        tracemalloc.stop()
+
+    def now(self):
+        return time.perf_counter() - self.began
+
+    def heartbeat(self, due):
+        """ Measure how late a 10 ms timer fires """
+        self.lags.append(max(time.perf_counter() - due, 0))
+        self.app.after(10, self.heartbeat, time.perf_counter() + 0.01)
+
+    def send_due(self):
+        """ Send every event whose time has come, then wait for the next one """
+        while self.next_event < len(self.events) and self.events[self.next_event]["at"] <= self.now():
+            event = self.events[self.next_event]
+            self.lags.append(self.now() - event["at"])
+            self.send(event)
+            self.next_event += 1
+            self.done += 1
+
+        if time.perf_counter() - self.reported >= self.report_every:
+            self.report()
+
+        if self.next_event >= len(self.events):
+            self.report()
+            self.app.destroy()
+            return
+        wait = max(self.events[self.next_event]["at"] - self.now(), 0)
+        self.app.after(int(wait * 1000), self.send_due)
+
+    def send(self, event):
+        """ Click through the frames the way a customer or admin would """
+        app = self.app
+        module = self.app_module
+        kind = event["kind"]
+        if kind in ("buy", "cancel"):
+            app.controller("selection", item=event["item"])
+            # Out of stock items stay on the selection menu
+            if app.shown is not module.Buy_Page:
+                return
+            app.frame(module.Buy_Page).deposit.set(str(event["deposit"]))
+            app.controller("buy", "buy")
+            if kind == "cancel" or app.shown is module.Buy_Page:
+                app.controller("buy", "back")
+        elif kind == "edit_item":
+            app.show_frame(module.Admin_Menu)
+            app.controller("admin", item=event["item"])
+            page = app.frame(module.Edit_Item)
+            page.price.set(str(event["cost"]))
+            page.stocks.set(str(event["number_of_items"]))
+            app.controller("edit_item", "save")
+            app.show_frame(module.Selection_Menu)
+        elif kind == "edit_balance":
+            app.show_frame(module.Admin_Menu)
+            app.controller("admin", item="balance")
+            app.frame(module.Edit_Balance).balance.set(str(event["balance"]))
+            app.controller("edit_balance", "save")
+            app.show_frame(module.Selection_Menu)
+
+    def report(self):
+        """ Print the measurements since the last report """
+        self.reported = time.perf_counter()
+        lags = sorted(self.lags)
+        switches = sorted(self.switches)
+        self.lags.clear()
+        self.switches.clear()
+        memory = tracemalloc.get_traced_memory()[0]
+        print(f"{self.now():8.1f}s {self.done:>8,} events  "
+              f"lag p50 {percentile(lags, 0.5) * 1000:6.2f} ms p99 {percentile(lags, 0.99) * 1000:7.2f} ms  "
+              f"switch p50 {percentile(switches, 0.5) * 1000:6.2f} ms p99 {percentile(switches, 0.99) * 1000:7.2f} ms  "
+              f"memory {(memory - self.first_memory) / 1024:+9.1f} KiB  widgets {count_widgets(self.app):,}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the candy machine app.")
+    parser.add_argument("--rate", type=float, default=20, help="events per second of a scripted stream")
+    parser.add_argument("--seconds", type=float, default=60, help="length of a scripted stream")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", metavar="FILE", help="send the events recorded in a JSON lines file instead")
+    parser.add_argument("--save-events", metavar="FILE", help="save the scripted events to replay them later")
+    parser.add_argument("--report-every", type=float, default=10, help="seconds between reports")
+    parser.add_argument("--xvfb", action="store_true", help="run on a new Xvfb display")
+    args = parser.parse_args()
+
+    xvfb = start_xvfb() if args.xvfb else None
+    try:
+        app_module = load_app_module()
+        # Questions would block the event loop, answer them yes
+        app_module.messagebox.askokcancel = answer_yes("askokcancel")
+        app_module.messagebox.askyesno = answer_yes("askyesno")
+        try:
+            app = app_module.App()
+        except app_module.tk.TclError as error:
+            sys.exit(f"Cannot open a window ({error}), run under Xvfb or pass --xvfb")
+
+        if args.replay:
+            events = read_events(args.replay)
+        else:
+            items = list(app.candy_machine.item_key)
+            events = list(scripted_events(random.Random(args.seed), items, args.rate, args.seconds))
+        if args.save_events:
+            with open(args.save_events, "w", encoding="utf-8") as file:
+                for event in events:
+                    file.write(json.dumps(event) + "\n")
+
+        Harness(app_module, app, events, args.report_every).run()
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+""" Load generator for server.py, reports latency percentiles on localhost """
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+async def client(host, port, requests, depth, latencies, rng):
+    """ Send requests over one connection, keeping up to depth of them in flight """
+    reader, writer = await asyncio.open_connection(host, port)
+    items = ["candy", "chip", "gum", "cookie"]
+    sent_at = {}
+    in_flight = asyncio.Semaphore(depth)
+
+    async def receive():
+        for _ in range(requests):
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent_at.pop(response["id"]))
+            in_flight.release()
+
+    receiver = asyncio.create_task(receive())
+    for number in range(requests):
+        await in_flight.acquire()
+        if rng.random() < 0.2:
+            request = {"id": number, "op": "stock"}
+        else:
+            request = {"id": number, "op": "buy", "item": rng.choice(items), "deposit": rng.choice((40, 50, 60))}
+        sent_at[number] = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+    await receiver
+    writer.close()
+    await writer.wait_closed()
+
+
+def percentile(ordered, fraction):
+    """ Value below which the given fraction of the sorted values fall """
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def run(args):
+    latencies = []
+    rng = random.Random(args.seed)
+    began = time.perf_counter()
+    await asyncio.gather(*(client(args.host, args.port, args.requests, args.depth, latencies, random.Random(rng.random()))
+                           for _ in range(args.connections)))
+    seconds = time.perf_counter() - began
+
+    latencies.sort()
+    print(f"{len(latencies):,} requests over {args.connections:,} connections in {seconds:.2f}s "
+          f"({len(latencies) / seconds:,.0f} requests/sec)")
+    print(f"p50 {percentile(latencies, 0.50) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against a candy machine server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="requests sent by each connection")
+    parser.add_argument("--depth", type=int, default=8, help="pipelined requests in flight per connection")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
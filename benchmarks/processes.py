@@ -0,0 +1,87 @@
+""" Throughput of sales from 1 to N processes sharing one candy machine through shared memory
+
+    python benchmarks/processes.py --processes 8 --sales 20000
+
+Every run also checks that no item was oversold: the stock left plus the
+items sold adds up to the starting stock, and the cash taken matches.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+# Let the benchmark run from the repository or from this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from candy_machine import Candy_Machine
+from shared_state import Shared_State
+
+
+def worker(spec, number, sales, start, results):
+    """ Sell from the shared machine, report how many sales were made """
+    candy_machine = Candy_Machine(session_timeout=None)
+    shared = Shared_State.open(spec)
+    shared.share(candy_machine)
+
+    items = list(candy_machine.item_key)
+    session = candy_machine.open_session()
+    sold = 0
+    start.wait()
+    for sale in range(sales):
+        session.select(items[(number + sale) % len(items)])
+        if session.sell_product(50):
+            sold += 1
+        else:
+            session.refund()
+    results.put(sold)
+    shared.close()
+
+
+def run(processes, sales):
+    """ Sell from many processes at once, return the sales per second and check nothing was oversold """
+    candy_machine = Candy_Machine(session_timeout=None)
+    # A little less stock than the sales tried, so the last items are fought over and overselling would show
+    stock = processes * sales * 95 // 100 // len(candy_machine.item_key)
+    for dispenser in candy_machine.item_key.values():
+        dispenser.number_of_items = stock
+    cash = candy_machine.cash_register.current_balance()
+    shared = Shared_State.create(candy_machine)
+
+    start = multiprocessing.Barrier(processes + 1)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(shared.spec(), number, sales, start, results))
+               for number in range(processes)]
+    for process in workers:
+        process.start()
+    start.wait()
+    began = time.perf_counter()
+    sold = sum(results.get() for _ in workers)
+    seconds = time.perf_counter() - began
+    for process in workers:
+        process.join()
+
+    left = sum(dispenser.get_count() for dispenser in candy_machine.item_key.values())
+    taken = candy_machine.cash_register.current_balance() - cash
+    shared.close()
+    assert left >= 0 and left + sold == stock * len(candy_machine.item_key), "Items were oversold or lost"
+    assert taken == sold * 50, "Cash does not match the sales"
+    return sold / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sales from many processes sharing one candy machine.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 4, help="largest number of processes")
+    parser.add_argument("--sales", type=int, default=20000, help="sales tried by each process")
+    args = parser.parse_args()
+
+    single = None
+    print(f"{'processes':>9}{'sales/sec':>14}{'speedup':>10}")
+    for processes in range(1, args.processes + 1):
+        rate = run(processes, args.sales)
+        single = single or rate
+        print(f"{processes:>9}{rate:>14,.0f}{rate / single:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
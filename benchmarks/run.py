@@ -0,0 +1,293 @@
+""" Benchmarks of the sale, admin and frame hot paths
+
+    python benchmarks/run.py                       # run and print
+    python benchmarks/run.py --save baseline.json  # keep the results as a baseline
+    python benchmarks/run.py --compare baseline.json --threshold 0.10
+    python benchmarks/run.py --profile --only "sale"  # memory allocated per sale by each line
+
+Frame benchmarks need a display, run them under Xvfb (e.g. xvfb-run) on
+headless machines, they are skipped when tk cannot open a window.
+--profile with "refresh frames" shows what each frame refresh allocates.
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from candy_machine import Candy_Machine
+from metrics import Registry_Sink
+from payments import Payment
+from reconcile import Reconciler
+
+
+def load_app_module():
+    """ Import the app, its file name is not a valid module name """
+    spec = importlib.util.spec_from_file_location("candy_machine_app", os.path.join(ROOT, "candy-machine.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stocked_machine():
+    """ Candy machine that will not run out of items or change during a benchmark """
+    candy_machine = Candy_Machine()
+    for dispenser in candy_machine.item_key.values():
+        dispenser.number_of_items = 10 ** 9
+    candy_machine.set_balance(10 ** 6)
+    return candy_machine
+
+
+def headless_benchmarks():
+    """ Returns (name, setup) pairs, setup returns the operation to time """
+    def sale():
+        candy_machine = stocked_machine()
+        session = candy_machine.open_session()
+        return lambda: session.sell_product(60)
+
+    def sale_from_text():
+        # Deposits typed in the app arrive as text
+        candy_machine = stocked_machine()
+        session = candy_machine.open_session()
+        return lambda: session.sell_product("60")
+
+    def invalid_deposit():
+        candy_machine = stocked_machine()
+        session = candy_machine.open_session()
+        return lambda: session.sell_product("6O")
+
+    def sale_with_metrics():
+        candy_machine = stocked_machine()
+        candy_machine.metrics = Registry_Sink()
+        session = candy_machine.open_session()
+        return lambda: session.sell_product(60)
+
+    def sale_with_reconciler():
+        candy_machine = stocked_machine()
+        Reconciler().attach(candy_machine)
+        session = candy_machine.open_session()
+        return lambda: session.sell_product(60)
+
+    def card_sale():
+        # Settling an approved payment, without the provider's latency
+        candy_machine = stocked_machine()
+        number = iter(range(10 ** 9))
+
+        def operation():
+            payment = Payment(next(number), "mock", "candy", 60)
+            payment.approved = True
+            return candy_machine.sell_paid("candy", payment)
+        return operation
+
+    def batch():
+        candy_machine = stocked_machine()
+        rows = [(item, 60) for item in candy_machine.item_key] * 250
+        return lambda: candy_machine.process_batch(rows)
+
+    def edit_item():
+        candy_machine = stocked_machine()
+        return lambda: candy_machine.edit_item("candy", 55, 10 ** 9)
+
+    def set_balance():
+        candy_machine = stocked_machine()
+        return lambda: candy_machine.set_balance(10 ** 6)
+
+    def dispenser_setters():
+        dispenser = stocked_machine().item_key["candy"]
+
+        def operation():
+            dispenser.cost = 50
+            dispenser.number_of_items = 50
+        return operation
+
+    def register_setter():
+        cash_register = stocked_machine().cash_register
+
+        def operation():
+            cash_register.cash_on_hand = 500
+        return operation
+
+    return [("sale", sale), ("sale from text", sale_from_text), ("invalid deposit", invalid_deposit), ("sale with metrics", sale_with_metrics), ("sale with reconciler", sale_with_reconciler), ("card sale", card_sale), ("batch of 1000", batch), ("edit item", edit_item), ("set balance", set_balance),
+            ("dispenser setters", dispenser_setters), ("register setter", register_setter)]
+
+
+def frame_benchmarks():
+    """ Frame benchmarks, empty if tk cannot open a window """
+    try:
+        app_module = load_app_module()
+        app = app_module.App()
+    except Exception as error:
+        print(f"Skipping frame benchmarks: {error}")
+        return []
+    app.withdraw()
+    # Messages are notifications by default, so gui sale never waits on a dialog
+
+    # Frames are built lazily, build them all so refresh frames covers every frame
+    for page in (app_module.Buy_Page, app_module.Admin_Menu, app_module.Edit_Item, app_module.Edit_Balance):
+        app.frame(page)
+
+    def build_frame():
+        def operation():
+            frame = app_module.Buy_Page(app, app.container)
+            frame.refresh(app.candy_machine)
+            frame.destroy()
+        return operation
+
+    def refresh_frames():
+        def operation():
+            app.refresh_frames()
+            app.update_idletasks()
+        return operation
+
+    def show_frame():
+        pages = [app_module.Selection_Menu, app_module.Admin_Menu]
+
+        def operation():
+            for page in pages:
+                app.show_frame(page)
+            app.update_idletasks()
+        return operation
+
+    def gui_sale():
+        for dispenser in app.candy_machine.item_key.values():
+            dispenser.number_of_items = 10 ** 9
+
+        def operation():
+            app.controller("selection", item="candy")
+            app.frame(app_module.Buy_Page).buy_entry.insert(0, "50")
+            app.controller("buy", "buy")
+            app.update_idletasks()
+        return operation
+
+    return [("build frame", build_frame), ("refresh frames", refresh_frames),
+            ("show frame", show_frame), ("gui sale", gui_sale)]
+
+
+def measure(setup, seconds):
+    """ Time an operation, returns ops/sec and the memory blocks and bytes allocated per op """
+    operation = setup()
+
+    # Find how many runs take about the time budget
+    runs = 1
+    while True:
+        began = time.perf_counter()
+        for _ in range(runs):
+            operation()
+        elapsed = time.perf_counter() - began
+        if elapsed >= seconds / 4:
+            break
+        runs *= 4
+    runs = max(int(runs * seconds / max(elapsed, 1e-9) / 2), 1)
+
+    gc.collect()
+    began = time.perf_counter()
+    for _ in range(runs):
+        operation()
+    ops_per_sec = runs / (time.perf_counter() - began)
+
+    # Allocations are counted in a separate run, tracemalloc slows everything down
+    lines = allocations(operation, min(runs, 1000))
+    return {"ops_per_sec": ops_per_sec, "blocks_per_op": sum(blocks for _, _, blocks in lines),
+            "bytes_per_op": sum(size for _, size, _ in lines)}
+
+
+def allocations(operation, runs):
+    """ Memory allocated per operation by each line, as (line, bytes, blocks), largest first
+
+    What each operation returns is kept, so a result allocated for every
+    sale is counted along with anything the operation leaves behind.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [operation() for _ in range(runs)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del kept
+
+    # Leave out the list of kept results and tracemalloc's own allocations
+    ignored = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "lineno")
+    return [(str(stat.traceback[0]), stat.size_diff / runs, stat.count_diff / runs) for stat in stats if stat.size_diff > 0]
+
+
+def profile(setup, runs=1000, top=8):
+    """ The lines allocating the most memory per operation, as (line, bytes, blocks) """
+    operation = setup()
+    operation()
+    return allocations(operation, runs)[:top]
+
+
+def compare(results, baseline, threshold):
+    """ Names of benchmarks slower than the baseline by more than the threshold """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            before = baseline[name]["ops_per_sec"]
+            if result["ops_per_sec"] < before * (1 - threshold):
+                regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the candy machine.")
+    parser.add_argument("--seconds", type=float, default=0.5, help="time spent timing each benchmark")
+    parser.add_argument("--only", help="run the benchmarks whose name contains this text")
+    parser.add_argument("--no-gui", action="store_true", help="skip the frame benchmarks")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown flagged as a regression")
+    parser.add_argument("--profile", action="store_true", help="show the lines allocating memory in each operation instead of timing them")
+    args = parser.parse_args()
+
+    benchmarks = headless_benchmarks()
+    if not args.no_gui:
+        benchmarks += frame_benchmarks()
+    if args.only:
+        benchmarks = [(name, setup) for name, setup in benchmarks if args.only in name]
+
+    if args.profile:
+        for name, setup in benchmarks:
+            lines = profile(setup)
+            print(f"{name}: {sum(size for _, size, _ in lines):,.1f} bytes per operation")
+            for line, size, blocks in lines:
+                print(f"    {size:>10,.1f} B {blocks:>8.2f} blocks  {line}")
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    results = {}
+    print(f"{'benchmark':<20}{'ops/sec':>14}{'blocks/op':>12}{'bytes/op':>12}{'vs baseline':>14}")
+    for name, setup in benchmarks:
+        result = results[name] = measure(setup, args.seconds)
+        change = ""
+        if name in baseline:
+            change = f"{result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1:+.1%}"
+        print(f"{name:<20}{result['ops_per_sec']:>14,.0f}{result['blocks_per_op']:>12.2f}"
+              f"{result['bytes_per_op']:>12,.1f}{change:>14}")
+
+    if "sale" in results and "sale with metrics" in results:
+        overhead = results["sale"]["ops_per_sec"] / results["sale with metrics"]["ops_per_sec"] - 1
+        print(f"Metrics overhead on the sale path: {overhead:+.1%}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
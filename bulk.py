@@ -0,0 +1,265 @@
+""" Import and export the prices, stocks and cash of candy machines in bulk, as CSV or JSON
+
+A file is a list of rows. An item row changes the cost and/or number of
+items of an item, a balance row changes the cash in the register, an empty
+field leaves the value as it is. Rows may name the machine they are for,
+rows without a machine are for every machine.
+
+    machine,item,cost,number_of_items,balance
+    ,candy,55,40,
+    kiosk-2,,,,900
+
+JSON files are a list of objects with the same keys, or one object per
+line (.jsonl). Files are read a row at a time so large files never have to
+fit in memory, only the final change of each item is kept.
+
+Every row is checked before anything is changed, so a file with a single
+invalid row changes nothing:
+
+    python bulk.py import changes.csv --state kiosk-1 --state kiosk-2
+    python bulk.py export config.csv --state kiosk-1
+
+Export only reads the state directories, so it can run next to the
+machines. Import journals the changes itself, stop the machines first,
+two writers of one journal lose each other's records.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+
+from candy_machine import Candy_Machine, load_catalog
+from journal import Journal
+from validation import parse_integer
+
+FIELDS = ["machine", "item", "cost", "number_of_items", "balance"]
+
+# Errors listed before giving up on a file
+MOST_ERRORS = 20
+
+# Size of the pieces a JSON file is read in
+CHUNK_SIZE = 1 << 16
+
+# Whitespace and commas between the values of a JSON list
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+def read_rows(path):
+    """ Yield each row of a CSV, JSON or JSON lines file as a dict """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as file:
+        if extension == ".csv":
+            yield from csv.DictReader(file)
+        elif extension == ".jsonl":
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == ".json":
+            yield from iter_json_array(file)
+        else:
+            raise ValueError(f"Unknown file type {extension!r}, use .csv, .json or .jsonl")
+
+
+def iter_json_array(file):
+    """ Yield the values of a JSON array one at a time, reading the file in chunks """
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("JSON file must be a list of rows")
+    position = 1
+
+    while True:
+        # Skip to the next value, reading more when the buffer runs out
+        position = SEPARATORS.match(buffer, position).end()
+        if position == len(buffer):
+            buffer = file.read(CHUNK_SIZE)
+            position = 0
+            if not buffer:
+                raise ValueError("JSON list is not closed")
+            continue
+        if buffer[position] == "]":
+            return
+
+        try:
+            value, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The value runs past the buffer
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield value
+
+
+class Config_Change():
+    """ Checked changes to one candy machine, applied all at once """
+    def __init__(self, candy_machine, machine=None):
+        self.candy_machine = candy_machine
+        self.machine = machine
+        # {item: [cost, number of items]}, none where the value is kept
+        self.items = {}
+        self.cash = None
+        self.errors = []
+        self.warnings = []
+
+    def __bool__(self):
+        return bool(self.items) or self.cash is not None
+
+    def add_row(self, number, row):
+        """ Check a row and keep its change, errors are collected rather than raised """
+        machine = row.get("machine") or None
+        if machine is not None and machine != self.machine:
+            return
+
+        # An empty field keeps the value as it is, the setters only take integers
+        values = []
+        for field in ("cost", "number_of_items", "balance"):
+            value = row.get(field)
+            if value is None or value == "":
+                values.append(None)
+                continue
+            value = parse_integer(value, strict=True)
+            if value is None:
+                self.errors.append(f"Row {number}: cost, number of items and balance must be integers.")
+                return
+            values.append(value)
+        cost, number_of_items, balance = values
+
+        item = row.get("item") or None
+        if item is not None:
+            if item not in self.candy_machine.item_key:
+                self.errors.append(f"Row {number}: {item!r} is not an item of this machine.")
+                return
+            change = self.items.setdefault(item, [None, None])
+            if cost is not None:
+                # Same rule as the cost setter
+                if cost <= 0:
+                    self.warnings.append(f"Row {number}: cost of {item} is not positive, it is set to the default.")
+                change[0] = cost
+            if number_of_items is not None:
+                # Same rule as the number of items setter
+                if number_of_items < 0:
+                    self.warnings.append(f"Row {number}: number of {item} is negative, it is set to the default.")
+                change[1] = number_of_items
+        elif cost is not None or number_of_items is not None:
+            self.errors.append(f"Row {number}: cost and number of items need an item.")
+            return
+
+        if balance is not None:
+            # Same rule as the cash setter
+            if balance < 0:
+                self.warnings.append(f"Row {number}: balance is negative, it is set to the default.")
+            self.cash = balance
+
+    def apply(self):
+        """ Change the candy machine, it is told about the changes once """
+        self.candy_machine.apply_config(self.items, self.cash)
+
+
+def plan_import(path, machines):
+    """ Read a file and check its rows for each (machine name, candy machine), returns the changes
+
+    Raises value error listing the invalid rows when any machine has one.
+    """
+    changes = [Config_Change(candy_machine, name) for name, candy_machine in machines]
+    for number, row in enumerate(read_rows(path), start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Row {number}: must be an object with {', '.join(FIELDS)}.")
+        for change in changes:
+            change.add_row(number, row)
+        if sum(len(change.errors) for change in changes) >= MOST_ERRORS:
+            break
+
+    errors = [f"{change.machine or 'machine'}: {error}" if len(changes) > 1 else error for change in changes for error in change.errors]
+    if errors:
+        raise ValueError("Nothing was changed, the file has invalid rows:\n" + "\n".join(errors[:MOST_ERRORS]))
+    return changes
+
+
+def import_config(path, candy_machine, machine=None):
+    """ Apply a file to a candy machine, all rows or none, returns the warnings """
+    change, = plan_import(path, [(machine, candy_machine)])
+    change.apply()
+    return change.warnings
+
+
+def export_rows(candy_machine, machine=None):
+    """ Rows holding the cost and stock of every item and the cash of a candy machine """
+    for item, dispenser in candy_machine.item_key.items():
+        yield {"machine": machine or "", "item": item, "cost": dispenser.cost, "number_of_items": dispenser.get_count(), "balance": ""}
+    yield {"machine": machine or "", "item": "", "cost": "", "number_of_items": "", "balance": candy_machine.cash_register.current_balance()}
+
+
+def export_config(path, machines):
+    """ Write the configuration of each (machine name, candy machine) to a CSV, JSON or JSON lines file """
+    extension = os.path.splitext(path)[1].lower()
+    rows = (row for name, candy_machine in machines for row in export_rows(candy_machine, name))
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if extension == ".csv":
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        elif extension in (".json", ".jsonl"):
+            # Write a row at a time, leaving out empty fields
+            separator = "\n" if extension == ".jsonl" else ",\n"
+            if extension == ".json":
+                file.write("[\n")
+            for index, row in enumerate(rows):
+                if index:
+                    file.write(separator)
+                file.write(json.dumps({key: value for key, value in row.items() if value != ""}))
+            file.write("\n]\n" if extension == ".json" else "\n")
+        else:
+            raise ValueError(f"Unknown file type {extension!r}, use .csv, .json or .jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the prices, stocks and cash of candy machines.",
+                                     epilog="Stop the machines before importing, export can run while they sell.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("file", help="CSV, JSON or JSON lines file")
+    parser.add_argument("--state", action="append", required=True, metavar="DIRECTORY",
+                        help="state directory of a machine, named after the directory, may be given many times")
+    parser.add_argument("--catalog", metavar="FILE", help="JSON file listing the slots of the machines")
+    args = parser.parse_args()
+
+    catalog = load_catalog(args.catalog) if args.catalog else None
+    journals = []
+    machines = []
+    for directory in args.state:
+        if not os.path.isdir(directory) and args.action == "export":
+            parser.error(f"{directory} is not a state directory")
+        candy_machine = Candy_Machine(catalog)
+        journal = Journal(directory)
+        if args.action == "export":
+            # Read without writing, the machine may still be running
+            journal.load(candy_machine)
+        else:
+            journal.attach(candy_machine)
+            journals.append(journal)
+        machines.append((os.path.basename(os.path.normpath(directory)), candy_machine))
+
+    try:
+        if args.action == "export":
+            export_config(args.file, machines)
+        else:
+            # Check the file against every machine before changing any
+            try:
+                changes = plan_import(args.file, machines)
+            except ValueError as error:
+                parser.exit(1, f"{error}\n")
+            for change in changes:
+                change.apply()
+                for warning in change.warnings:
+                    print(f"{change.machine}: {warning}")
+                print(f"{change.machine}: {len(change.items)} items changed" + (", balance changed" if change.cash is not None else ""))
+    finally:
+        for journal in journals:
+            journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,164 @@
+import time
+
+# Taken before the other imports so --startup-times can report how long they took
+STARTED = time.perf_counter()
+
+import argparse
+import os
 import tkinter as tk
-from tkinter import messagebox
+from collections import deque
+from tkinter import filedialog, messagebox
+
+from candy_machine import MAX_DEPOSIT, Candy_Machine, Sale_Result, load_catalog
+from metrics import Prometheus_File_Sink
+from reconcile import EDITS, Reconciler
+from restock import Restock_Forecast, format_hours
+from validation import accepts_amount, accepts_signed_amount, parse_integer
+
+# Optional features import their modules where their option or button is used,
+# the server alone pulls in asyncio, so startup only pays for what is turned on
+
+IMPORTED = time.perf_counter()
+
+# How often a payment being authorized is checked, and how long it may take, in milliseconds and seconds
+PAYMENT_POLL_MS = 50
+PAYMENT_TIMEOUT = 30
 
 
 def main():
+    parser = argparse.ArgumentParser(description="My Candy Machine")
+    parser.add_argument("--catalog", metavar="FILE", help="JSON file listing the slots of the machine")
+    parser.add_argument("--state", metavar="DIRECTORY", help="keep the stocks and cash in this directory across restarts")
+    parser.add_argument("--group-commit", type=int, default=64, help="number of journal records synced to disk together")
+    parser.add_argument("--ledger", metavar="DIRECTORY", help="record every sale and edit in a queryable ledger in this directory")
+    parser.add_argument("--pricing", metavar="FILE", help="JSON file of time of day, stock level and happy hour pricing rules")
+    parser.add_argument("--forecast", metavar="FILE", help="keep the sales velocity used by the restock forecasts in this file")
+    parser.add_argument("--metrics", metavar="FILE", help="write counters and timers to this Prometheus text file")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="also sell to remote terminals on this TCP port")
+    parser.add_argument("--payment", action="append", default=[], metavar="PROVIDER",
+                        help="take card or voucher payments from this provider, mock or package.module:Class_Name, may be given many times")
+    parser.add_argument("--payment-latency", type=float, default=0.5, metavar="SECONDS", help="time the mock provider takes to answer")
+    parser.add_argument("--payment-failure-rate", type=float, default=0.1, metavar="FRACTION", help="share of payments the mock provider declines")
+    parser.add_argument("--session-timeout", type=float, default=60, metavar="SECONDS", help="refund a customer inactive for this long, 0 never does")
+    parser.add_argument("--dialogs", action="store_true", help="show messages in modal dialogs instead of notifications")
+    parser.add_argument("--no-prewarm", action="store_true", help="only build each frame the first time it is shown")
+    parser.add_argument("--startup-times", action="store_true", help="print how long the imports, the candy machine and the first paint took")
+    args = parser.parse_args()
+
     # Launch the app
-    app = App()
+    journal = ledger = pricing_rules = None
+    providers = []
+    if args.state:
+        from journal import Journal
+        journal = Journal(args.state, group_commit=args.group_commit)
+    catalog = load_catalog(args.catalog) if args.catalog else None
+    metrics = Prometheus_File_Sink(args.metrics) if args.metrics else None
+    if args.ledger:
+        from ledger import Ledger
+        ledger = Ledger(args.ledger)
+    if args.payment:
+        from payments import load_provider
+        try:
+            providers = [load_provider(spec, latency=args.payment_latency, failure_rate=args.payment_failure_rate) if spec == "mock" else load_provider(spec)
+                         for spec in args.payment]
+        except ValueError as error:
+            parser.error(str(error))
+    if args.pricing:
+        from pricing import load_rules
+        pricing_rules = load_rules(args.pricing)
+    app = App(journal, catalog, metrics, ledger, prewarm=not args.no_prewarm, session_timeout=args.session_timeout, dialogs=args.dialogs,
+              forecast_path=args.forecast, pricing_rules=pricing_rules, payment_providers=providers)
+
+    if args.startup_times:
+        # Run the event loop until the selection menu is on screen
+        app.wait_visibility()
+        app.update_idletasks()
+        painted = time.perf_counter()
+        print(f"imports:       {(IMPORTED - STARTED) * 1000:8.1f} ms")
+        print(f"candy machine: {app.startup_times['candy machine'] * 1000:8.1f} ms")
+        print(f"first frame:   {app.startup_times['first frame'] * 1000:8.1f} ms")
+        print(f"first paint:   {(painted - STARTED) * 1000:8.1f} ms after start")
+
+    # Serve remote terminals from a background thread so the window stays responsive
+    if args.serve is not None:
+        from server import Candy_Server
+        # The app expires sessions itself, so it can tell its own customer
+        try:
+            Candy_Server(app.candy_machine, port=args.serve, expire_every=None).start_in_thread()
+        except OSError as error:
+            app.destroy()
+            parser.error(f"Cannot serve on port {args.serve}: {error.strerror or error}")
     app.mainloop()
 
 
+def update_var(variable, value):
+    """ Set a tk variable only when its value changed, so untouched widgets are not redrawn """
+    value = str(value)
+    if variable.get() != value:
+        variable.set(value)
+
+
+class Message():
+    """ Text of a message kept as a template and its fields, only formatted once it is shown """
+    __slots__ = ("template", "fields")
+
+    def __init__(self, template, **fields):
+        self.template = template
+        self.fields = fields
+
+    def __str__(self):
+        return self.template.format(**self.fields)
+
+    # Repeated messages are found without formatting them
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return self.template == other.template and self.fields == other.fields
+
+
 class App(tk.Tk):
     """ GUI app """
-    def __init__(self):
+    def __init__(self, journal=None, catalog=None, metrics=None, ledger=None, prewarm=True, session_timeout=60, dialogs=False, forecast_path=None, pricing_rules=None,
+                 payment_providers=()):
         super().__init__()
+        self.startup_times = {}
+        began = time.perf_counter()
         
-        # Create a candy machine
-        self.candy_machine = Candy_Machine()
+        # Create a candy machine, restoring it from the journal if there is one
+        self.candy_machine = Candy_Machine(catalog, session_timeout)
+        if metrics:
+            self.candy_machine.metrics = metrics
+        self.metrics = self.candy_machine.metrics
+        self.journal = journal
+        if self.journal:
+            self.journal.attach(self.candy_machine)
+        # Record history after recovery, replayed changes are already in the ledger
+        self.ledger = ledger
+        if self.ledger:
+            self.ledger.attach(self.candy_machine)
+        # Predict when items run out from how fast they sell, continuing from the saved velocity if there is one
+        self.forecast = Restock_Forecast()
+        self.forecast_path = forecast_path
+        if forecast_path and os.path.exists(forecast_path):
+            self.forecast.load(forecast_path)
+        self.forecast.attach(self.candy_machine)
+        # Count the cash and stocks against the books after every sale and edit, discrepancies are shown by poll_changes
+        self.discrepancies = deque(maxlen=100)
+        self.reconciler = Reconciler(self.discrepancies.append)
+        self.reconciler.attach(self.candy_machine)
+
+        # Prices follow the rules when there are some, otherwise items sell at their cost
+        if pricing_rules:
+            from pricing import Pricing
+            Pricing(pricing_rules).attach(self.candy_machine)
+
+        # Card and voucher payments are authorized on other threads, the payment waited for is checked with after()
+        self.payments = None
+        if payment_providers:
+            from payments import Payments
+            self.payments = Payments(self.candy_machine, payment_providers)
+        self.pending_payment = None
+        self.startup_times["candy machine"] = time.perf_counter() - began
 
         # Set up initial settings
         self.title('My Candy Machine')
@@ -30,87 +174,307 @@ class App(tk.Tk):
         self.container.grid_rowconfigure(0, weight=1)
         self.container.grid_columnconfigure(0, weight=1)
 
+        # Messages are shown as notifications over the frames, unless modal dialogs are asked for
+        self.dialogs = dialogs
+        self.toasts = Toast_Area(self)
+
         # Create Frames
         self.frames = {}
+        self.shown = None
         self.Selection_Menu = Selection_Menu
         self.Admin_Menu = Admin_Menu
         self.Buy_Page = Buy_Page
         self.Edit_Balance = Edit_Balance
         self.Edit_Item = Edit_Item
 
-        # Build each frames
+        # Only build the selection menu now, the other frames are built when first shown
+        began = time.perf_counter()
         self.build_frames()
         
         # Show selection menu
         self.show_frame(Selection_Menu)
+        self.startup_times["first frame"] = time.perf_counter() - began
+
+        # Build the other frames while the app is idle, so the first visit does not wait for them
+        if prewarm:
+            self.after_idle(self.prewarm_frames)
+
+        # Watch for changes made outside the app (e.g. remote terminals), tk may only be updated from this thread
+        self.changed = False
+        self.candy_machine.add_listener(self.on_change)
+        self.after(250, self.poll_changes)
 
     def build_frames(self):
-        """ Build each frame """
-        for F in {Selection_Menu, Admin_Menu, Buy_Page, Edit_Balance, Edit_Item}:
-            # Build each frame, inheriting app and container
-            frame = F(self, self.container)
-            # Put each frame in a frame list
-            self.frames[F] = frame
-            # Show the frame and place them on top of each other
-            frame.grid(row=0, column=0, sticky="nsew")
+        """ Build the frame shown at startup """
+        with self.metrics.timer("candy_build_frames_seconds"):
+            self.frame(Selection_Menu)
+
+    def frame(self, F):
+        """ The frame of a page, built the first time it is asked for """
+        frame = self.frames.get(F)
+        if frame is None:
+            frame = self.create_frame(F)
+        return frame
+
+    def create_frame(self, F):
+        """ Build a frame without timing it """
+        # Build the frame, inheriting app and container
+        frame = F(self, self.container)
+        # Put the frame in the frame list
+        self.frames[F] = frame
+        # Place the frames on top of each other
+        frame.grid(row=0, column=0, sticky="nsew")
+        # Fill the frame with the current values of the candy machine
+        frame.refresh(self.candy_machine)
+        return frame
+
+    def prewarm_frames(self):
+        """ Build one frame that is not built yet, then wait for the next idle time to build another """
+        for F in (Buy_Page, Admin_Menu, Edit_Item, Edit_Balance):
+            if F not in self.frames:
+                self.create_frame(F)
+                # Keep the frame shown on top
+                if self.shown is not None:
+                    self.frames[self.shown].tkraise()
+                self.after_idle(self.prewarm_frames)
+                return
+
+    def refresh_frames(self, skip=None):
+        """ Update the widgets of each frame but the skipped one to match the candy machine """
+        for F, frame in self.frames.items():
+            if F is not skip:
+                frame.refresh(self.candy_machine)
+
+    def on_change(self, event, details):
+        """ Remember that the candy machine changed, may be called from any thread """
+        self.changed = True
+
+    def poll_changes(self):
+        """ Update the frames if the candy machine changed since the last poll, time out inactive customers and follow the hourly prices """
+        self.candy_machine.update_prices()
+
+        # A customer who walked away gets the deposit back and frees the machine for the next one
+        if self.candy_machine.session in self.candy_machine.expire_sessions() and self.shown is Buy_Page:
+            # A card payment still being authorized must not sell once the customer is gone
+            self.cancel_payment()
+            self.frame(Buy_Page).buy_entry.delete(0, tk.END)
+            self.show_frame(Selection_Menu)
+            self.dialog(messagebox.showinfo, "Timed Out", "The purchase was cancelled after no activity.\nAny cash deposited was returned.")
+
+        # Admin edits were made on purpose, only unexplained discrepancies are shown
+        while self.discrepancies:
+            discrepancy = self.discrepancies.popleft()
+            if discrepancy.kind not in EDITS:
+                self.dialog(messagebox.showerror, "Reconciliation", discrepancy.describe())
+
+        if self.changed:
+            self.changed = False
+            # Sales from other terminals must not overwrite what the admin is typing, the page is refreshed once it is saved or opened again
+            self.refresh_frames(skip=self.shown if self.shown in (Edit_Item, Edit_Balance) else None)
+        self.after(250, self.poll_changes)
 
     def show_frame(self, cont):
         """ Show the frame """
-        frame = self.frames[cont]
+        frame = self.frame(cont)
         frame.tkraise()
+        self.shown = cont
 
     def on_closing(self):
         """ Reprompt when closing """
-        if messagebox.askyesno(title="Exit?", message="Do you really want to close 'My Candy Machine'?"):
+        if self.dialog(messagebox.askyesno, title="Exit?", message="Do you really want to close 'My Candy Machine'?"):
+            if self.journal:
+                self.journal.close()
+            if self.ledger:
+                self.ledger.close()
+            self.reconciler.close()
+            if self.payments:
+                self.payments.close()
+            if self.forecast_path:
+                self.forecast.save(self.forecast_path)
             self.destroy()
     
+    def select_item(self, item):
+        """ Select an item in the candy machine, return false if it is invalid """
+        try:
+            self.candy_machine.select(item)
+        except ValueError:
+            self.dialog(messagebox.showerror, "Error", "An error has occured.\nSelected item is invalid.")
+            return False
+        return True
+
+    def show_result(self, result):
+        """ Inform the customer about the result of a purchase, the message is formatted only if it is shown """
+        if result.status == Sale_Result.OUT_OF_STOCK:
+            self.dialog(messagebox.showerror, "Error", Message("Sorry {item} is out of stock.", item=result.item))
+        elif result.status == Sale_Result.INVALID_DEPOSIT:
+            self.dialog(messagebox.showerror, "Error", f"Inserted cash must be positive number of at most ${MAX_DEPOSIT:,}.")
+        elif result.status == Sale_Result.INSUFFICIENT_DEPOSIT:
+            self.dialog(messagebox.showinfo, "Insufficient Deposit", Message("Deposit ${missing} more.", missing=result.missing))
+        elif result.status == Sale_Result.NO_CHANGE:
+            self.dialog(messagebox.showerror, "No Change", Message("Sorry, there is no change for your ${deposit:,.2f} deposit.\nPlease deposit the exact amount or press back to get your deposit.", deposit=result.deposit))
+        # If there is change, return it
+        elif result.change:
+            self.dialog(messagebox.showinfo, "Success", Message("Successfully purchased a {item}!\nHere is your {item}! Enjoy!\n\nHere also is your change of ${change:,.2f}.", item=result.item, change=result.change))
+        else:
+            self.dialog(messagebox.showinfo, "Success", Message("Successfully purchased a {item}!\nHere is your {item}! Enjoy!", item=result.item))
+
+    def check_payment(self, future, began):
+        """ Sell the item once the payment is authorized, checked again with after() until then """
+        # The customer went back or paid cash meanwhile
+        if future is not self.pending_payment:
+            return
+
+        if not future.done():
+            if time.perf_counter() - began < PAYMENT_TIMEOUT:
+                self.after(PAYMENT_POLL_MS, self.check_payment, future, began)
+                return
+            # Give up on a provider that does not answer
+            self.cancel_payment()
+            self.show_frame(Selection_Menu)
+            self.dialog(messagebox.showerror, "Payment Failed", "The payment was not answered in time, nothing was charged.")
+            return
+
+        self.pending_payment = None
+        update_var(self.frame(Buy_Page).payment_status, "")
+        payment = future.result()
+        result = self.payments.settle(self.candy_machine.session, payment)
+        if result.status == Sale_Result.DECLINED:
+            self.dialog(messagebox.showerror, "Payment Declined", payment.reason)
+        else:
+            self.show_result(result)
+
+        if result:
+            self.refresh_frames()
+            self.show_frame(Selection_Menu)
+
+    def cancel_payment(self):
+        """ Stop waiting for the payment being authorized, it is voided if it is approved later """
+        if self.pending_payment is None:
+            return
+        self.payments.abandon(self.pending_payment)
+        self.pending_payment = None
+        update_var(self.frame(Buy_Page).payment_status, "")
+        # Nothing was deposited, so this only ends the session
+        self.candy_machine.refund()
+
+    def import_file(self):
+        """ Apply the prices, stocks and balance of a CSV or JSON file, all of them or none """
+        path = filedialog.askopenfilename(title="Import", filetypes=[("CSV or JSON", "*.csv *.json *.jsonl")])
+        if not path:
+            return
+        try:
+            from bulk import import_config
+            warnings = import_config(path, self.candy_machine)
+        except (OSError, ValueError) as error:
+            self.dialog(messagebox.showerror, "Import Failed", str(error))
+            return
+
+        # Update the frames once for the whole file
+        self.refresh_frames()
+        self.dialog(messagebox.showinfo, "Imported", "\n".join(warnings) or "Every change was saved.")
+
+    def export_file(self):
+        """ Save the prices, stocks and balance to a CSV or JSON file """
+        path = filedialog.asksaveasfilename(title="Export", defaultextension=".csv", filetypes=[("CSV", "*.csv"), ("JSON", "*.json"), ("JSON lines", "*.jsonl")])
+        if not path:
+            return
+        try:
+            from bulk import export_config
+            export_config(path, [(None, self.candy_machine)])
+        except (OSError, ValueError) as error:
+            self.dialog(messagebox.showerror, "Export Failed", str(error))
+            return
+        self.dialog(messagebox.showinfo, "Exported", f"Saved to {path}.")
+
+    def dialog(self, show, *args, **kwargs):
+        """ Show a message, as a notification unless it asks a question or dialogs are turned on """
+        if self.dialogs or show.__name__.startswith("ask"):
+            # Time how long the user takes to close the message box
+            with self.metrics.timer("candy_dialog_seconds", kind=show.__name__):
+                # Message boxes only take text
+                args = [str(arg) if isinstance(arg, Message) else arg for arg in args]
+                kwargs = {name: str(value) if isinstance(value, Message) else value for name, value in kwargs.items()}
+                return show(*args, **kwargs)
+
+        # Message boxes take the title and message by position or by name
+        title = kwargs.get("title", args[0] if args else "")
+        message = kwargs.get("message", args[1] if len(args) > 1 else "")
+        self.metrics.count("candy_notifications_total", kind=show.__name__)
+        self.toasts.push(title, message, error=show is messagebox.showerror)
+
     def controller(self, coming_from, doing=None, item=None):
         """ Control the app """
+        with self.metrics.timer("candy_controller_seconds", coming_from=coming_from):
+            return self.control(coming_from, doing, item)
+
+    def control(self, coming_from, doing=None, item=None):
+        """ Handle a controller call without timing it """
         # Determine what to do based on where the controller is called
         # If called from selection menu
         if coming_from == "selection":
             # If an item is passed, set the current item to that
             if item:
-                self.candy_machine.item = item
+                if not self.select_item(item):
+                    return
 
                 # Do not redirect buy page if there is no more stocks left
                 if self.candy_machine.item_key[self.candy_machine.item].get_count() <= 0:
-                    return messagebox.showerror("Error", f"Sorry, {self.candy_machine.item} is out of stock.")
+                    return self.dialog(messagebox.showerror, "Error", f"Sorry, {self.candy_machine.item} is out of stock.")
 
-                # Rebuild the frames to update them
-                self.build_frames()
+                # Update the frames then clear the entry box
+                self.refresh_frames()
+                self.frame(Buy_Page).buy_entry.delete(0, tk.END)
 
                 # Focus on the entry box then redirect to buy page
-                self.frames[Buy_Page].buy_entry.focus_set()
+                self.frame(Buy_Page).buy_entry.focus_set()
                 self.show_frame(Buy_Page)
 
         # If called from buy page
         elif coming_from == "buy":
             # If pressed deposit button (aka buy)
             if doing == "buy":
-                # Sell the product and determine if it was successful
-                is_successful = self.candy_machine.sell_product(self.frames[Buy_Page].buy_entry.get())
+                # Paying cash instead of waiting for a card payment
+                self.cancel_payment()
+
+                # Sell the product and inform the customer about the result
+                result = self.candy_machine.sell_product(self.frame(Buy_Page).buy_entry.get())
+                self.show_result(result)
 
                 # Clear the entry box
-                self.frames[Buy_Page].buy_entry.delete(0, tk.END)
+                self.frame(Buy_Page).buy_entry.delete(0, tk.END)
 
                 # If transaction is successful (deposit is enough to buy the item)
-                if is_successful:
-                    # Rebuild frames to update the available stocks and cash in the candy machine
-                    self.build_frames()
+                if result:
+                    # Update the frames to show the available stocks and cash in the candy machine
+                    self.refresh_frames()
                     # Redirect to selection menu
                     self.show_frame(Selection_Menu)
 
+            # If pressed the button of a payment provider, start authorizing without waiting for it
+            elif doing == "pay":
+                if self.pending_payment is not None:
+                    return
+                try:
+                    self.candy_machine.session.authorize()
+                except ValueError:
+                    return self.dialog(messagebox.showerror, "Error", "Press back to get your deposit before paying by card.")
+
+                cost = self.candy_machine.item_key[self.candy_machine.item].get_product_cost()
+                self.pending_payment = self.payments.authorize(item, self.candy_machine.item, cost)
+                update_var(self.frame(Buy_Page).payment_status, f"Waiting for {item} to approve ${cost:,}...")
+                self.after(PAYMENT_POLL_MS, self.check_payment, self.pending_payment, time.perf_counter())
+
             # If pressed back button
             elif doing == "back":
+                # Stop waiting for a card payment
+                self.cancel_payment()
+
                 # IF there is a deposit, return it to the customer
                 if self.candy_machine.deposit != 0:
                     # Aks the customer if sure to cancel the transaction
-                    if messagebox.askokcancel(title="Cancel?", message=f"Are you sure you want to cancel the purchase of {self.candy_machine.item}?"):
-                        messagebox.showinfo(title="Return", message=f"Here is the ${self.candy_machine.deposit:,.2f} you deposited.")
-                        
-                        # Reset the deposit, then redirect to selection menu
-                        self.candy_machine.deposit = 0
+                    if self.dialog(messagebox.askokcancel, title="Cancel?", message=f"Are you sure you want to cancel the purchase of {self.candy_machine.item}?"):
+                        # Return the deposit, then redirect to selection menu
+                        self.dialog(messagebox.showinfo, title="Return", message=f"Here is the ${self.candy_machine.refund():,.2f} you deposited.")
                         self.show_frame(Selection_Menu)
                 
                 # If there is no deposit, just go back to selection menu
@@ -121,53 +485,52 @@ class App(tk.Tk):
         elif coming_from == "admin":
             # If an item is selected update the current item
             if not item or item != "balance":
-                self.candy_machine.item = item
+                if not self.select_item(item):
+                    return
             
-            # Rebuild the page to update it
-            self.build_frames()
+            # Update the pages to show the selected item
+            self.refresh_frames()
 
             # If balance is selected, then focus to entry box, and redirect to edit balance page
             if item == "balance":
-                self.frames[Edit_Balance].balance_entry.focus_set()
+                self.frame(Edit_Balance).balance_entry.focus_set()
                 self.show_frame(Edit_Balance)
 
             # If item is selected, then focust to entry_box, and redirect to edit item page
             else:
-                self.frames[Edit_Item].price_entry.focus_set()
+                self.frame(Edit_Item).price_entry.focus_set()
                 self.show_frame(Edit_Item)
 
         # If called from edit balance
         elif coming_from == "edit_balance":
             # If save changes button is pressed
             if doing == "save":
-                # Ensure entered balance is valid
-                try:
-                    # Get the entered balance from edit balance page
-                    entered_balance = int(self.frames[Edit_Balance].balance_entry.get())
-
-                # Infrom them about the error
-                except (TypeError, ValueError):
-                    messagebox.showerror("Error", "Balance in the candy machine must be a positive integer.")
-                    # Rebuild the frames then redirect to edit balance page
-                    self.build_frames()
+                # Get the entered balance from edit balance page
+                entered_balance = parse_integer(self.frame(Edit_Balance).balance_entry.get())
+
+                # Ensure entered balance is valid, infrom them about the error
+                if entered_balance is None:
+                    self.dialog(messagebox.showerror, "Error", "Balance in the candy machine must be a positive integer.")
+                    # Update the frames then redirect to edit balance page
+                    self.refresh_frames()
                     self.show_frame(Edit_Balance)
                     return
 
                 # Inform them if no changes occured
                 if self.candy_machine.cash_register.current_balance() == entered_balance:
-                    messagebox.showerror("Error", "Balance in the candy machine remains the same.")
+                    self.dialog(messagebox.showerror, "Error", "Balance in the candy machine remains the same.")
 
                 # If entered balance is negative, set to the default (set up in cash setter in register class)
                 elif entered_balance < 0:
-                    messagebox.showinfo("Warning", "Balance in the machine were set to default due to invalid input.")
+                    self.dialog(messagebox.showinfo, "Warning", "Balance in the machine were set to default due to invalid input.")
 
                 # If valid, update the cash on hand in register
                 else:
-                    self.candy_machine.cash_register.cash_register(entered_balance)
-                    messagebox.showinfo("success", f"There are ${self.candy_machine.cash_register.current_balance():,.2f} in the candy machine.")
+                    self.candy_machine.set_balance(entered_balance)
+                    self.dialog(messagebox.showinfo, "success", f"There are ${self.candy_machine.cash_register.current_balance():,.2f} in the candy machine.")
 
-                # Rebuild the frames, and stay on edit balance page
-                self.build_frames()
+                # Update the frames, and stay on edit balance page
+                self.refresh_frames()
                 self.show_frame(Edit_Balance)
 
         # If called from edit item
@@ -177,38 +540,171 @@ class App(tk.Tk):
                 # Get the current dispenser based on the current item
                 current_dispenser = self.candy_machine.item_key[self.candy_machine.item]
 
-                # Ensure entered price and number of stock is valid
-                try:
-                    entered_price = int(self.frames[Edit_Item].price_entry.get())
-                    entered_stocks = int(self.frames[Edit_Item].stocks_entry.get())
-
-                # Inform them about the error
-                except (TypeError, ValueError):
-                    messagebox.showerror("Error", "Price and number of stocks must be a positive integer.")
-                    # Rebuild the frames then redirect to edit balance page
-                    self.build_frames()
+                # Get the entered price and number of stock from edit item page
+                entered_price = parse_integer(self.frame(Edit_Item).price_entry.get())
+                entered_stocks = parse_integer(self.frame(Edit_Item).stocks_entry.get())
+
+                # Ensure entered price and number of stock is valid, inform them about the error
+                if entered_price is None or entered_stocks is None:
+                    self.dialog(messagebox.showerror, "Error", "Price and number of stocks must be a positive integer.")
+                    # Update the frames then redirect to edit item page
+                    self.refresh_frames()
                     self.show_frame(Edit_Item)
                     return
 
                 # Inform them if no changes occured
-                if current_dispenser.get_count() == entered_stocks and current_dispenser.get_product_cost() == entered_price:
-                    messagebox.showerror("Error", "Price and number of stocks remains the same.")
+                if current_dispenser.get_count() == entered_stocks and current_dispenser.cost == entered_price:
+                    self.dialog(messagebox.showerror, "Error", "Price and number of stocks remains the same.")
 
                 # If entered price is negative or entered stocks is non positive then set to default (set up in price and stocks setter in dispenser class)
                 elif entered_price <= 0 or entered_stocks < 0:
-                    messagebox.showinfo("Warning", "Values were set to default due to invalid values.")
+                    self.dialog(messagebox.showinfo, "Warning", "Values were set to default due to invalid values.")
 
                 # If valid, update the price and number of available stocks of the item
                 else:
-                    current_dispenser.dispenser(entered_price, entered_stocks)
-                    messagebox.showinfo("Success", "Changes were saved.\n")
+                    self.candy_machine.edit_item(self.candy_machine.item, entered_price, entered_stocks)
+                    self.dialog(messagebox.showinfo, "Success", "Changes were saved.\n")
 
-                # Rebuild the frames and stay on edit item page
-                self.build_frames()
+                # Update the frames and stay on edit item page
+                self.refresh_frames()
                 self.show_frame(Edit_Item)
 
 
 
+class Toast_Area(tk.Frame):
+    """ Notifications shown over the bottom of the window one after another, they close by themselves or when clicked
+
+    Messages wait in a queue. A message equal to the one shown or waiting
+    last is counted instead of queued again, and each message is shown for
+    less time while others wait, so a quick run of purchases never piles up.
+    """
+    def __init__(self, parent, duration=2500, error_duration=4000, shortest=600):
+        super().__init__(parent, bg="#F2E5E5", bd=2, relief="ridge")
+        self.duration = duration
+        self.error_duration = error_duration
+        self.shortest = shortest
+        # Waiting messages as [title, message, error, count]
+        self.queue = deque()
+        self.current = None
+        self.hide_job = None
+
+        self.text = tk.StringVar()
+        self.label = tk.Label(self, textvariable=self.text, font="Helvetica 13", bg="#F2E5E5", justify="center", wraplength=700, padx=20, pady=10)
+        self.label.pack(fill="both", expand=True)
+
+        # Close the notification when clicked
+        self.label.bind("<Button-1>", lambda event: self.next())
+
+    def push(self, title, message, error=False):
+        """ Queue a message, counting it in the last one if they are the same """
+        last = self.queue[-1] if self.queue else self.current
+        if last is not None and last[:3] == [title, message, error]:
+            last[3] += 1
+            if last is self.current:
+                self.draw()
+            return
+
+        self.queue.append([title, message, error, 1])
+        if self.current is None:
+            self.next()
+
+    def next(self):
+        """ Show the next waiting message, or hide if there is none """
+        if self.hide_job is not None:
+            self.after_cancel(self.hide_job)
+            self.hide_job = None
+
+        if not self.queue:
+            self.current = None
+            self.place_forget()
+            return
+
+        self.current = self.queue.popleft()
+        self.draw()
+        self.place(relx=0.5, rely=1.0, anchor="s", y=-20)
+        self.lift()
+
+        # Show it for less time the more messages wait
+        duration = self.error_duration if self.current[2] else self.duration
+        duration = max(duration // (1 + len(self.queue)), self.shortest)
+        self.hide_job = self.after(duration, self.next)
+
+    def draw(self):
+        """ Show the current message with how many times it came """
+        title, message, error, count = self.current
+        times = f" (x{count})" if count > 1 else ""
+        self.label.config(fg="#B00020" if error else "black")
+        update_var(self.text, f"{title}{times}\n{message}")
+
+
+class Item_List(tk.Frame):
+    """ Scrollable list of item buttons, only the visible rows have buttons so machines with many slots stay fast """
+    def __init__(self, container, dispensers, command, rows, font, bg):
+        super().__init__(container, bg=bg)
+        self.dispensers = dispensers
+        self.command = command
+        self.offset = 0
+
+        # Set up the grid of the list
+        self.grid_columnconfigure(0, weight=1)
+
+        # Fixed pool of buttons, scrolling only changes their text
+        self.buttons = []
+        for row in range(rows):
+            self.grid_rowconfigure(row, weight=1)
+            button = tk.Button(self, font=font, bg=bg, command=lambda row=row: self.pick(row))
+            button.grid(row=row, column=0, sticky="nesw")
+            button.bind("<MouseWheel>", self.on_wheel)
+            button.bind("<Button-4>", lambda event: self.scroll("scroll", -1, "units"))
+            button.bind("<Button-5>", lambda event: self.scroll("scroll", 1, "units"))
+            self.buttons.append(button)
+
+        # Scrollbar, only shown when there are more items than buttons
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.scroll)
+        self.scrollbar.grid(row=0, column=1, rowspan=rows, sticky="ns")
+
+        self.redraw()
+
+    def pick(self, row):
+        """ Run the command with the item on a button """
+        index = self.offset + row
+        if index < len(self.dispensers):
+            self.command(self.dispensers.skus[index])
+
+    def on_wheel(self, event):
+        """ Scroll with the mouse wheel """
+        self.scroll("scroll", -1 if event.delta > 0 else 1, "units")
+
+    def scroll(self, action, amount, unit=None):
+        """ Move the list, takes the arguments a scrollbar gives its command """
+        rows = len(self.buttons)
+        if action == "moveto":
+            offset = round(float(amount) * len(self.dispensers))
+        else:
+            offset = self.offset + int(amount) * (rows if unit == "pages" else 1)
+        offset = max(0, min(offset, len(self.dispensers) - rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.redraw()
+
+    def redraw(self):
+        """ Label each button with the item it shows """
+        total = len(self.dispensers)
+        for row, button in enumerate(self.buttons):
+            index = self.offset + row
+            if index < total:
+                button.config(text=self.dispensers.names[index], state="normal")
+            else:
+                button.config(text="", state="disabled")
+
+        # Hide the scrollbar when every item fits
+        if total > len(self.buttons):
+            self.scrollbar.grid()
+            self.scrollbar.set(self.offset / total, (self.offset + len(self.buttons)) / total)
+        else:
+            self.scrollbar.grid_remove()
+
+
 class Selection_Menu(tk.Frame):
     """ Starting page, select a product to buy or access admin menu """
     def __init__(self, parent, container):
@@ -228,21 +724,9 @@ class Selection_Menu(tk.Frame):
         intstructions = tk.Label(self, text="Press an item to purchase!", font="Helvetica 18 bold", fg="black", bg="#FFD1D1")
         intstructions.grid(row=1, column=0, columnspan=2, sticky="nesw")
 
-        # Candy button
-        candy = tk.Button(self, text="Candy", font="Helvetica 15", bg="#E8C4C4", command=lambda: parent.controller("selection", item="candy"))
-        candy.grid(row=2, column=0, columnspan=2, sticky="nesw")
-
-        # Chip button
-        chip = tk.Button(self, text="Chip", font="Helvetica 15", bg="#E8C4C4", command=lambda: parent.controller("selection", item="chip"))
-        chip.grid(row=3, column=0, columnspan=2, sticky="nesw")
-
-        # Gum button
-        gum = tk.Button(self, text="Gum", font="Helvetica 15", bg="#E8C4C4", command=lambda: parent.controller("selection", item="gum"))
-        gum.grid(row=4, column=0, columnspan=2, sticky="nesw")
-
-        # Cookie button
-        cookie = tk.Button(self, text="Cookie", font="Helvetica 15", bg="#E8C4C4", command=lambda: parent.controller("selection", item="cookie"))
-        cookie.grid(row=5, column=0, columnspan=2, sticky="nesw")
+        # Item buttons, one per slot in the catalog
+        self.items = Item_List(self, parent.candy_machine.dispensers, lambda item: parent.controller("selection", item=item), rows=4, font="Helvetica 15", bg="#E8C4C4")
+        self.items.grid(row=2, column=0, rowspan=4, columnspan=2, sticky="nesw")
 
         # Exit button
         exit = tk.Button(self, text="Exit", font="Helvetica 15", bg="#F2E5E5", command=parent.on_closing)
@@ -252,6 +736,10 @@ class Selection_Menu(tk.Frame):
         admin = tk.Button(self, text="Admin", font="Helvetica 15", bg="#E8C4C4", command=lambda: parent.show_frame(parent.Admin_Menu))
         admin.grid(row=6, column=1, sticky="nesw")
 
+    def refresh(self, candy_machine):
+        """ Update the names of the items """
+        self.items.redraw()
+
 
 class Admin_Menu(tk.Frame):
     """ Allow admin to manage the cost, stocks of an item, and cash on the register """
@@ -275,26 +763,40 @@ class Admin_Menu(tk.Frame):
         balance = tk.Button(self, text="Balance", font="Times 15", bg="#E8C4C4", command=lambda: parent.controller("admin", item="balance"))
         balance.grid(row=2, column=0, sticky="nesw")
 
-        # Candy button
-        candy = tk.Button(self, text="Candy", font="Times 15", bg="#E8C4C4", command=lambda: parent.controller("admin", item="candy"))
-        candy.grid(row=3, column=0, sticky="nesw")
-
-        # Chip button
-        chip = tk.Button(self, text="Chip", font="Times 15", bg="#E8C4C4", command=lambda: parent.controller("admin", item="chip"))
-        chip.grid(row=4, column=0, sticky="nesw")
-
-        # Gum button
-        gum = tk.Button(self, text="Gum", font="Times 15", bg="#E8C4C4", command=lambda: parent.controller("admin", item="gum"))
-        gum.grid(row=5, column=0, sticky="nesw")
-
-        # Cookie button
-        cookie = tk.Button(self, text="Cookie", font="Times 15", bg="#E8C4C4", command=lambda: parent.controller("admin", item="cookie"))
-        cookie.grid(row=6, column=0, sticky="nesw")
+        # Item buttons, one per slot in the catalog
+        self.items = Item_List(self, parent.candy_machine.dispensers, lambda item: parent.controller("admin", item=item), rows=4, font="Times 15", bg="#E8C4C4")
+        self.items.grid(row=3, column=0, rowspan=4, sticky="nesw")
 
         # Exit button
         back = tk.Button(self, text="Back", font="Times 15", bg="#F2E5E5", command=lambda: parent.show_frame(parent.Selection_Menu))
         back.grid(row=7, column=0, sticky="nesw", ipadx=15)
 
+        # Items expected to run out first
+        self.forecast = parent.forecast
+        self.outlook = tk.StringVar(self)
+        outlook = tk.Label(self, textvariable=self.outlook, font="Times 13", fg="white", bg="#CE7777")
+        outlook.grid(row=8, column=0, sticky="nesw")
+
+        # Import and export buttons, to change many items at once
+        files = tk.Frame(self, bg="#CE7777")
+        files.grid(row=9, column=0, sticky="nesw")
+        files.grid_columnconfigure((0, 1), weight=1)
+        import_button = tk.Button(files, text="Import", font="Times 15", bg="#E8C4C4", command=parent.import_file)
+        import_button.grid(row=0, column=0, sticky="nesw")
+        export_button = tk.Button(files, text="Export", font="Times 15", bg="#E8C4C4", command=parent.export_file)
+        export_button.grid(row=0, column=1, sticky="nesw")
+
+    def refresh(self, candy_machine):
+        """ Update the names of the items and the items expected to run out first """
+        self.items.redraw()
+
+        forecasts = sorted((hours, item) for item, (_, _, hours) in self.forecast.forecast(candy_machine).items() if hours is not None)
+        if forecasts:
+            soonest = ", ".join(f"{item} in {format_hours(hours)}" if hours else f"{item} now" for hours, item in forecasts[:3])
+            update_var(self.outlook, f"Runs out first: {soonest}")
+        else:
+            update_var(self.outlook, "No item is expected to run out soon.")
+
 
 class Buy_Page(tk.Frame):
     """ Prompts for a deposit to buy the item """
@@ -311,11 +813,15 @@ class Buy_Page(tk.Frame):
         title.grid(row=0, column=0, columnspan=2, sticky="nesw")
         
         # Instruction
-        instructions = tk.Label(self, text=f"Deposit ${parent.candy_machine.item_key[parent.candy_machine.item].get_product_cost():,} to buy a {parent.candy_machine.item}:", font="Helvetica 18 bold", fg="black", bg="#FFD1D1")
+        self.instructions = tk.StringVar(self)
+        instructions = tk.Label(self, textvariable=self.instructions, font="Helvetica 18 bold", fg="black", bg="#FFD1D1")
         instructions.grid(row=1, column=0, columnspan=2,sticky="nesw")
 
-        # Deposit entry box
-        self.buy_entry = tk.Entry(self, font="Helvetica 25", justify="center")
+        # Deposit entry box, checked on every keystroke and only taking digits
+        self.deposit = tk.StringVar(self)
+        self.deposit.trace_add("write", lambda *args: self.on_typing(parent.candy_machine))
+        self.buy_entry = tk.Entry(self, textvariable=self.deposit, font="Helvetica 25", justify="center",
+                                  validate="key", validatecommand=(self.register(accepts_amount), "%P"))
         self.buy_entry.grid(row=2, column=0, columnspan=2)
         self.buy_entry.focus_get()
 
@@ -323,10 +829,48 @@ class Buy_Page(tk.Frame):
         deposit = tk.Button(self, text="Deposit", font="Helvetica 15", bg="#C0EEE4", command=lambda: parent.controller("buy", "buy"))
         deposit.grid(row=3, column=0, columnspan=2, ipadx=15)
 
+        # Warning if the machine has no change for the deposit
+        self.change_warning = tk.StringVar(self)
+        change_warning = tk.Label(self, textvariable=self.change_warning, font="Helvetica 15", fg="#CE7777", bg="#FFD1D1")
+        change_warning.grid(row=4, column=0, columnspan=2, sticky="nesw")
+
+        # A button for each payment provider, and the payment being waited for
+        self.payment_status = tk.StringVar(self)
+        if parent.payments:
+            providers = tk.Frame(self, bg="#FFD1D1")
+            providers.grid(row=5, column=0, columnspan=2)
+            for name in parent.payments.providers:
+                pay = tk.Button(providers, text=f"Pay by {name}", font="Helvetica 15", bg="#C0EEE4", command=lambda name=name: parent.controller("buy", "pay", item=name))
+                pay.pack(side="left", padx=10, ipadx=15)
+            payment_status = tk.Label(self, textvariable=self.payment_status, font="Helvetica 15", fg="black", bg="#FFD1D1")
+            payment_status.grid(row=6, column=0, columnspan=2, sticky="nesw")
+
         # Back/Cancel button
         back = tk.Button(self, text="Back", font="Helvetica 15", bg="#FFD1D1", command=lambda: parent.controller("buy", "back"))
         back.grid(row=8, column=0, sticky="w", ipadx=15, padx=20, pady=20)
 
+    def refresh(self, candy_machine):
+        """ Update the price and name of the selected item """
+        update_var(self.instructions, f"Deposit ${candy_machine.item_key[candy_machine.item].get_product_cost():,} to buy a {candy_machine.item}:")
+        self.check_change(candy_machine)
+
+    def on_typing(self, candy_machine):
+        """ Keep the customer's session alive while they type, and warn about change """
+        candy_machine.session.touch()
+        self.check_change(candy_machine)
+
+    def check_change(self, candy_machine):
+        """ Warn while typing if the machine cannot give change for the deposit """
+        deposit = candy_machine.deposit + (parse_integer(self.deposit.get()) or 0)
+        cost = candy_machine.item_key[candy_machine.item].get_product_cost()
+
+        if deposit > MAX_DEPOSIT:
+            update_var(self.change_warning, f"Sorry, the machine takes at most ${MAX_DEPOSIT:,}.")
+        elif candy_machine.cash_register.can_give_change(deposit, cost):
+            update_var(self.change_warning, "")
+        else:
+            update_var(self.change_warning, f"Sorry, there is no change for ${deposit:,}. Please deposit the exact amount.")
+
 
 class Edit_Balance(tk.Frame):
     """ Change the cash on register of the candy machine """
@@ -350,9 +894,10 @@ class Edit_Balance(tk.Frame):
         balance = tk.Label(self, text="Amount of cash in the candy machine:", font="Times 18 bold", fg="white", bg="#CE7777")
         balance.grid(row=3, column=0, columnspan=2 ,sticky="esw")
 
-        # Balance entry box
-        self.balance_entry = tk.Entry(self, font="Times 25", justify="center")
-        self.balance_entry.insert(0, parent.candy_machine.cash_register.current_balance())
+        # Balance entry box, keystrokes that cannot make an integer are rejected
+        self.balance = tk.StringVar(self)
+        self.balance_entry = tk.Entry(self, textvariable=self.balance, font="Times 25", justify="center",
+                                      validate="key", validatecommand=(self.register(accepts_signed_amount), "%P"))
         self.balance_entry.grid(row=4, column=0, columnspan=2)
 
         # Save button
@@ -363,6 +908,10 @@ class Edit_Balance(tk.Frame):
         back = tk.Button(self, text="Back", font="Times 15", fg="white", bg="#CE7777", command=lambda: parent.show_frame(Admin_Menu))
         back.grid(row=8, column=0, sticky="w", ipadx=15, padx=20, pady=20)
 
+    def refresh(self, candy_machine):
+        """ Update the entry box to the cash in the register """
+        update_var(self.balance, candy_machine.cash_register.current_balance())
+
 
 class Edit_Item(tk.Frame):
     """ Update the price and availabe stock in the dispenser of the candy machine """
@@ -379,236 +928,61 @@ class Edit_Item(tk.Frame):
         title.grid(row=0, column=0, columnspan=2, sticky="nesw")
 
         # Instruction
-        instructions = tk.Label(self, text=f"Save the changes to edit the values of {parent.candy_machine.item}.", font="Times 18 bold", fg="white", bg="#CE7777")
+        self.instructions = tk.StringVar(self)
+        instructions = tk.Label(self, textvariable=self.instructions, font="Times 18 bold", fg="white", bg="#CE7777")
         instructions.grid(row=1, column=0, columnspan=2,sticky="nesw")
 
         # Price label
-        price = tk.Label(self, text=f"Price of a {parent.candy_machine.item}:", font="Times 18 bold", fg="white", bg="#CE7777")
+        self.price_label = tk.StringVar(self)
+        price = tk.Label(self, textvariable=self.price_label, font="Times 18 bold", fg="white", bg="#CE7777")
         price.grid(row=2, column=0, columnspan=2 ,sticky="esw")
 
-        # Price entry box
-        self.price_entry = tk.Entry(self, font="Times 25", justify="center")
-        self.price_entry.insert(0, parent.candy_machine.item_key[parent.candy_machine.item].get_product_cost())
+        # Price entry box, keystrokes that cannot make an integer are rejected
+        self.price = tk.StringVar(self)
+        self.price_entry = tk.Entry(self, textvariable=self.price, font="Times 25", justify="center",
+                                    validate="key", validatecommand=(self.register(accepts_signed_amount), "%P"))
         self.price_entry.grid(row=3, column=0, columnspan=2)
 
         # Stock label
-        stocks = tk.Label(self, text=f"Number of available {parent.candy_machine.item}:", font="Times 18 bold", fg="white", bg="#CE7777")
+        self.stocks_label = tk.StringVar(self)
+        stocks = tk.Label(self, textvariable=self.stocks_label, font="Times 18 bold", fg="white", bg="#CE7777")
         stocks.grid(row=4, column=0, columnspan=2 ,sticky="esw")
 
-        # Stock entry box
-        self.stocks_entry = tk.Entry(self, font="Times 25", justify="center")
-        self.stocks_entry.insert(0, parent.candy_machine.item_key[parent.candy_machine.item].get_count())
+        # Stock entry box, keystrokes that cannot make an integer are rejected
+        self.stocks = tk.StringVar(self)
+        self.stocks_entry = tk.Entry(self, textvariable=self.stocks, font="Times 25", justify="center",
+                                     validate="key", validatecommand=(self.register(accepts_signed_amount), "%P"))
         self.stocks_entry.grid(row=5, column=0, columnspan=2)
 
         # Save button
         save = tk.Button(self, text="Save Changes", font="Times 15", fg="white", bg="#2B3A55", command=lambda: parent.controller("edit_item", "save"))
         save.grid(row=6, column=0, columnspan=2, ipadx=15)
 
+        # Forecast of when the item runs out
+        self.forecast = parent.forecast
+        self.outlook = tk.StringVar(self)
+        outlook = tk.Label(self, textvariable=self.outlook, font="Times 15", fg="white", bg="#CE7777")
+        outlook.grid(row=7, column=0, columnspan=2, sticky="nesw")
+
         # Back button
         back = tk.Button(self, text="Back", font="Times 15", fg="white", bg="#CE7777", command=lambda: parent.show_frame(Admin_Menu))
         back.grid(row=8, column=0, sticky="w", ipadx=15, padx=20, pady=20)
 
-
-
-class Candy_Machine():
-    """ Created in the app """
-    def __init__(self):
-        """ Initalize the components of candy machine """
-        self.cash_register = self.Cash_Register()
-        self.candy_dispenser = self.Dispenser()
-        self.chip_dispenser = self.Dispenser()
-        self.gum_dispenser = self.Dispenser()
-        self.cookie_dispenser = self.Dispenser()
-
-        # Key mapping to access each items' dispenser
-        self.item_key = {"candy": self.candy_dispenser,
-                         "chip": self.chip_dispenser,
-                         "gum": self.gum_dispenser,
-                         "cookie": self.cookie_dispenser}
-
-        # Variables accessed/modified app
-        self.deposit = 0
-        self.item = "candy"
-
-    # Item Getter
-    @property
-    def item(self):
-        return self._item
-
-    # Item Setter
-    @item.setter
-    def item(self, item):
-        # Ensures the item maps to the key
-        if not item or item not in self.item_key:
-            return messagebox.showerror("Error", "An error has occured.\nSelected item is invalid.")
+    def refresh(self, candy_machine):
+        """ Update the labels and entry boxes to the selected item """
+        item = candy_machine.item
+        update_var(self.instructions, f"Save the changes to edit the values of {item}.")
+        dispenser = candy_machine.item_key[item]
+        # The entry is the cost, pricing rules may make the item sell at another price
+        if dispenser.get_product_cost() != dispenser.cost:
+            update_var(self.price_label, f"Price of a {item} (sells at ${dispenser.get_product_cost():,} now):")
         else:
-            self._item = item
-
-    # Deposit Getter
-    @property
-    def deposit(self):
-        return self._deposit
-
-    # Desposit Setter
-    @deposit.setter
-    def deposit(self, deposit):
-        # Ensures deposit is a non negative integer
-        if deposit < 0:
-            raise ValueError("Deposit must be positive.")
-        else:
-            self._deposit = deposit
-
-
-    def sell_product(self, new_deposit):
-        """ Sell the item selected by the customer, return true if purchase is successful """
-
-        # Ensure that the chosen item is not out of stock
-        if self.item_key[self.item].get_count() <= 0:
-            messagebox.showerror("Error", f"Sorry {self.item} is out of stock.")
-            return False
-        # Ensures the inserted deposit is an non negative integer
-        try:
-            new_deposit = int(new_deposit)
-            if new_deposit > 0:
-                self.deposit += new_deposit
-        # Show error message if inserted deposit is invalid
-        except (ValueError, TypeError):
-            messagebox.showerror("Error", f"Inserted cash must be positive number.")
-            return False
-
-        # Asks for more deposit if deposit is not enough to buy the item
-        if self.deposit < self.item_key[self.item].get_product_cost():
-            messagebox.showinfo("Insufficient Deposit", f"Deposit ${self.item_key[self.item].get_product_cost() - self.deposit} more.")
-            return False
-
-        # Give the item if deposit is enough
-        self.item_key[self.item].makeSale()
-
-        # Register takes in the payment (not total deposit, just the price of item)
-        self.cash_register.accept_amount(self.item_key[self.item].get_product_cost())
-
-        # Inform the user about the successful transcation
-        # If there is change, return it
-        if  self.deposit != self.item_key[self.item].get_product_cost():
-            messagebox.showinfo("Success", f"Successfully purchased a {self.item}!\nHere is your {self.item}! Enjoy!\n\nHere also is your change of ${self.deposit - self.item_key[self.item].get_product_cost():,.2f}.")
-        else:
-            messagebox.showinfo("Success", f"Successfully purchased a {self.item}!\nHere is your {self.item}! Enjoy!")
-        
-        # Reset the deposit
-        self.deposit = 0
-        return True
-
-
-
-    # Component (inner class) of Candy Machine
-    class Cash_Register():
-        """ Handles money """
-
-        def __init__(self, cash_on_hand=500):
-            self.cash_on_hand = cash_on_hand
-
-        # Cash Getter
-        @property
-        def cash_on_hand(self):
-            return self._cash_on_hand
-
-        # Cash Setter
-        @cash_on_hand.setter
-        def cash_on_hand(self, cash_on_hand):
-            # Ensure cash is an integer
-            if isinstance(cash_on_hand, int):
-                # Change cash to default value if less than 0 (instructed in pdf)
-                if cash_on_hand < 0:
-                    self._cash_on_hand = 500
-                else:
-                    self._cash_on_hand = cash_on_hand
-            else:
-                raise TypeError("Cash on Hand must be an integer")
-
-        # Prints out the cash by calling register itself
-        def __str__(self):
-            return f"Cash on hand is ${self.cash_on_hand:,.2f}"
-
-        def cash_register(self, cash_in=500):
-            """ Let candy machine modify cash on hand """
-            self.cash_on_hand = cash_in
-
-        def current_balance(self):
-            """ Shows the current amount in the cash register """
-            return self.cash_on_hand
-
-        def accept_amount(self, amount_in):
-            """ Accepts the amount entered by the customer """
-            # Ensures the amount paid by the customer is valid
-            if isinstance(amount_in, int) and amount_in > 0:
-                # Add the payment of customer to current cash on hand
-                self.cash_on_hand += amount_in
-            else:
-                raise TypeError("Amount In must be non negative integer")
-
-    # Component (inner class) of Candy Machine
-    class Dispenser:
-        """ Handles product """
-        def __init__(self, cost=50, number_of_items=50):
-            self.cost = cost
-            self.number_of_items = number_of_items
-
-        # Cost Getter
-        @property
-        def cost(self):
-            return self._cost
-
-        # Cost Setter
-        @cost.setter
-        def cost(self, cost):
-            # Ensures cost of an item is an integer
-            if isinstance(cost, int):
-                # If cost of an item is not positive, set to default 50 (instructed in pdf)
-                if cost <= 0:
-                    self._cost = 50
-                else:
-                    self._cost = cost 
-            else:
-                raise TypeError("Cost must be an integer")
-
-        # Getter
-        @property
-        def number_of_items(self):
-            return self._number_of_items
-
-        # Setter
-        @number_of_items.setter
-        def number_of_items(self, number_of_items):
-            # Ensures the number if items in stock is an integer
-            if isinstance(number_of_items, int):
-                # If the number of items in stock is negative, set to default 50 (instructed in pdf)
-                if number_of_items < 0:
-                    self._number_of_items = 50 
-                else:
-                    self._number_of_items = number_of_items 
-            else:
-                raise TypeError("Number of Items must be an integer")
-
-        # Prints out the cost and number of items by calling dispenser itself
-        def __str__(self):
-            return f"Cost is ${self.cost:,.2f} and Number of Items is {self.number_of_items}"
-
-        def dispenser(self, set_cost=50, set_no_of_items=50):
-            """ Let candy machine modify number of items and cost of an item """
-            self.cost = set_cost
-            self.number_of_items = set_no_of_items
-
-        def get_count(self):
-            """ returns the number of items in stock if an an item """
-            return self.number_of_items
-
-        def get_product_cost(self):
-            """ returns the cost of an item """
-            return self.cost
+            update_var(self.price_label, f"Price of a {item}:")
+        update_var(self.price, dispenser.cost)
+        update_var(self.stocks_label, f"Number of available {item}:")
+        update_var(self.stocks, candy_machine.item_key[item].get_count())
+        update_var(self.outlook, self.forecast.describe(item, candy_machine.item_key[item].get_count()))
 
-        def makeSale(self):
-            """ Product sold, so reduce number of items in stock by 1 """
-            self.number_of_items -= 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,1155 @@
+""" Candy machine model, runs without a GUI """
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import ExitStack
+from functools import lru_cache
+
+from metrics import CHANGE_BUCKETS, TIME_BUCKETS, Null_Sink
+from validation import parse_integer
+
+
+# Bills and coins the cash register holds, largest first
+DENOMINATIONS = (100, 50, 20, 10, 5, 1)
+
+# Largest deposit a customer can make, a stack of a hundred of the largest bills
+MAX_DEPOSIT = 100 * DENOMINATIONS[0]
+
+# Most the fewest bills can pay in denominations below the largest while some of the largest are left, one short of a largest bill of each
+CHANGE_SEARCH = sum((DENOMINATIONS[0] // denomination - 1) * denomination for denomination in DENOMINATIONS[1:]) + 1
+
+# Payment references the cash register remembers, so a retried settlement is not taken twice
+SETTLED_REFERENCES = 10000
+
+# One sale in this many is timed, reading the clock twice costs about as much as counting the sale
+TIME_SAMPLE = 16
+
+
+def split_into_bills(amount):
+    """ Fewest bills adding up to the amount, as a count per denomination """
+    counts = []
+    for denomination in DENOMINATIONS:
+        counts.append(amount // denomination)
+        amount %= denomination
+    return tuple(counts)
+
+
+def split_into_float(amount):
+    """ Spread an amount over every denomination so the register can give change """
+    # Take whole rounds of one of each denomination at once so large amounts stay fast
+    rounds = max(amount // sum(DENOMINATIONS) - 1, 0)
+    counts = [rounds] * len(DENOMINATIONS)
+    amount -= rounds * sum(DENOMINATIONS)
+
+    # Add one of each denomination, smallest first, while the amount allows it
+    while amount >= DENOMINATIONS[-1]:
+        for index in reversed(range(len(DENOMINATIONS))):
+            if DENOMINATIONS[index] <= amount:
+                counts[index] += 1
+                amount -= DENOMINATIONS[index]
+    return tuple(counts)
+
+
+def change_for(amount, counts):
+    """ Fewest bills adding up to the amount using at most counts of each denomination
+
+    Returns a count per denomination, or None if the amount cannot be paid.
+    """
+    # The denominations are canonical, so when the register has the bills of the
+    # greedy split no other split can use fewer bills
+    bills = split_into_bills(amount)
+    if all(needed <= count for needed, count in zip(bills, counts)):
+        return bills
+
+    # Any 100 // d bills of a smaller denomination d add up to a hundred, so
+    # unless the hundreds run out the fewest bills pay all but less than
+    # CHANGE_SEARCH with hundreds, only the rest needs searching
+    largest = DENOMINATIONS[0]
+    if amount - CHANGE_SEARCH >= largest * counts[0]:
+        taken = counts[0]
+    else:
+        taken = max(-(-(amount - CHANGE_SEARCH) // largest), 0)
+    left = (counts[0] - taken,) + counts[1:]
+    amount -= taken * largest
+
+    # Out of hundreds the search is only bounded by the deposit, skip it when the register cannot pay
+    if amount > sum(count * denomination for count, denomination in zip(left, DENOMINATIONS)):
+        return None
+    rest = fewest_bills(amount, left)
+    if rest is None:
+        return None
+    return (taken + rest[0],) + rest[1:]
+
+
+@lru_cache(maxsize=4096)
+def fewest_bills(amount, counts):
+    """ Fewest bills adding up to the amount using at most counts of each denomination
+
+    Bounded knapsack with a sliding window minimum, O(amount) per denomination,
+    and cached since the same amount and inventory repeat on every keystroke.
+    change_for() asks it for amounts below CHANGE_SEARCH plus a hundred,
+    unless the register is out of hundreds.
+    """
+    impossible = amount + 1
+    best = [0] + [impossible] * amount
+    choices = []
+
+    for denomination, count in zip(DENOMINATIONS, counts):
+        previous = best
+        best = previous[:]
+        used = [0] * (amount + 1)
+        # Totals with the same remainder only reach each other through this denomination
+        for remainder in range(min(denomination, amount + 1)):
+            window = deque()
+            for step, total in enumerate(range(remainder, amount + 1, denomination)):
+                # Using k bills of this denomination means starting from step - k, with k <= count
+                value = previous[total] - step
+                while window and window[-1][1] >= value:
+                    window.pop()
+                window.append((step, value))
+                if window[0][0] < step - count:
+                    window.popleft()
+                start, start_value = window[0]
+                if start_value + step < best[total]:
+                    best[total] = start_value + step
+                    used[total] = step - start
+        choices.append(used)
+
+    if best[amount] >= impossible:
+        return None
+
+    # Walk back through the choices to find how many of each denomination were used
+    change = [0] * len(DENOMINATIONS)
+    for index in reversed(range(len(DENOMINATIONS))):
+        change[index] = choices[index][amount]
+        amount -= change[index] * DENOMINATIONS[index]
+    return tuple(change)
+
+
+# Items of a machine when no catalog file is given
+DEFAULT_CATALOG = [{"slot": "A1", "sku": "candy", "name": "Candy", "cost": 50, "number_of_items": 50},
+                   {"slot": "A2", "sku": "chip", "name": "Chip", "cost": 50, "number_of_items": 50},
+                   {"slot": "A3", "sku": "gum", "name": "Gum", "cost": 50, "number_of_items": 50},
+                   {"slot": "A4", "sku": "cookie", "name": "Cookie", "cost": 50, "number_of_items": 50}]
+
+
+def load_catalog(path):
+    """ Read the slots of a machine from a JSON file holding a list of {slot, sku, name, cost, number_of_items} """
+    with open(path, encoding="utf-8") as file:
+        catalog = json.load(file)
+    if not isinstance(catalog, list):
+        raise ValueError("Catalog must be a list of slots")
+    return catalog
+
+
+class Sale_Result():
+    """ Outcome of an attempt to buy the selected item """
+
+    # Possible outcomes of a purchase
+    SUCCESS = "success"
+    OUT_OF_STOCK = "out of stock"
+    INVALID_DEPOSIT = "invalid deposit"
+    INSUFFICIENT_DEPOSIT = "insufficient deposit"
+    NO_CHANGE = "no change"
+    DECLINED = "declined"
+
+    # One is made for every sale, without a __dict__ each takes a third of the memory
+    __slots__ = ("status", "item", "cost", "deposit", "bills")
+
+    def __init__(self, status, item, cost=0, deposit=0, bills=None):
+        self.status = status
+        self.item = item
+        self.cost = cost
+        self.deposit = deposit
+        # Count of each denomination given as change
+        self.bills = bills
+
+    # Treat the result as true only if the item was sold
+    def __bool__(self):
+        return self.status == Sale_Result.SUCCESS
+
+    def __eq__(self, other):
+        if not isinstance(other, Sale_Result):
+            return NotImplemented
+        return ((self.status, self.item, self.cost, self.deposit, self.bills)
+                == (other.status, other.item, other.cost, other.deposit, other.bills))
+
+    def __repr__(self):
+        return f"Sale_Result({self.status!r}, {self.item!r}, cost={self.cost}, deposit={self.deposit})"
+
+    @property
+    def change(self):
+        """ Cash returned to the customer after a successful sale """
+        return self.deposit - self.cost if self else 0
+
+    @property
+    def missing(self):
+        """ Cash the customer still has to deposit to buy the item """
+        return max(self.cost - self.deposit, 0)
+
+
+class Sale_Metrics():
+    """ Records the outcome and time of sales
+
+    Each thread bumps its own tally keyed by item, outcome, cost and deposit,
+    without locks. The sink's counters and histograms are filled from the
+    tallies when the metrics are read, so the sale path stays cheap. Only
+    one sale in TIME_SAMPLE is timed, the sell time histogram holds that
+    sample, and file sinks are only written after a timed sale.
+    """
+    def __init__(self, sink):
+        self.sink = sink
+        self.enabled = sink.enabled
+        # Only sales recorded by an enabled sink need a tally per thread
+        self.local = threading.local() if self.enabled else None
+        # Tally, time bucket counts and time sum of every thread that recorded a sale
+        self.tallies = []
+        # Sales left until the next timed one, shared by the threads, a race only moves the sample
+        self.untimed = TIME_SAMPLE
+        if self.enabled:
+            sink.add_collector(self.collect)
+        # File sinks write their file now and then
+        self.write_if_due = getattr(sink, "write_if_due", None)
+
+    def thread_tally(self):
+        """ Tally of the calling thread, created on its first sale """
+        tally = self.local.tally = ({}, [0] * (len(TIME_BUCKETS) + 1), [0])
+        self.tallies.append(tally)
+        return tally
+
+    def record(self, result, seconds=None):
+        """ Count the outcome of a sale, and its time if it was timed """
+        try:
+            counts, times, time_sum = self.local.tally
+        except AttributeError:
+            counts, times, time_sum = self.thread_tally()
+
+        key = (result.item, result.status, result.cost, result.deposit)
+        counts[key] = counts.get(key, 0) + 1
+
+        if seconds is not None:
+            times[bisect_left(TIME_BUCKETS, seconds)] += 1
+            time_sum[0] += seconds
+            if self.write_if_due is not None:
+                self.write_if_due()
+
+    def collect(self):
+        """ Set the sink's counters and histograms to the totals of every thread """
+        totals = {}
+        time_counts = [0] * (len(TIME_BUCKETS) + 1)
+        time_sum = 0
+        for counts, times, thread_time_sum in list(self.tallies):
+            # Copying a dict is atomic, the thread may keep counting meanwhile
+            for key, count in counts.copy().items():
+                totals[key] = totals.get(key, 0) + count
+            time_counts = [total + count for total, count in zip(time_counts, times)]
+            time_sum += thread_time_sum[0]
+
+        sink = self.sink
+        with sink.lock:
+            values = {}
+            sell_time = sink.histogram("candy_sell_product_seconds")
+            change = sink.histogram("candy_change_given", CHANGE_BUCKETS)
+            sell_time.counts = time_counts
+            sell_time.sum = time_sum
+            sell_time.count = sum(time_counts)
+            change.counts = [0] * (len(CHANGE_BUCKETS) + 1)
+            change.sum = change.count = 0
+
+            for (item, status, cost, deposit), count in totals.items():
+                change_given = deposit - cost
+                if status == Sale_Result.SUCCESS:
+                    names = (("candy_sales_total", "item", item, count), ("candy_revenue_total", "item", item, count * cost))
+                    change.counts[bisect_left(CHANGE_BUCKETS, change_given)] += count
+                    change.sum += change_given * count
+                    change.count += count
+                elif status == Sale_Result.OUT_OF_STOCK:
+                    names = (("candy_stockouts_total", "item", item, count),)
+                else:
+                    names = (("candy_rejected_deposits_total", "reason", status.replace(" ", "_"), count),)
+                for name, label, value, amount in names:
+                    values[(name, label, value)] = values.get((name, label, value), 0) + amount
+
+            for (name, label, value), amount in values.items():
+                sink.counter(name, **{label: value}).value = amount
+
+
+class Timer_Wheel():
+    """ Refunds sessions left inactive for timeout seconds
+
+    Sessions are kept in a ring of slots, one per tick of time. Keeping a
+    session alive only moves its deadline; the wheel finds the new deadline
+    when it reaches the session's slot and moves it on. So each activity
+    costs O(1) no matter how many sessions are open. A finished session
+    leaves its slot at once, and only slots holding sessions take memory,
+    a machine nobody uses keeps an empty wheel.
+    """
+    def __init__(self, timeout=60, tick=1, slots=256, clock=time.monotonic):
+        self.timeout = timeout
+        self.tick = tick
+        self.clock = clock
+        # Sessions of each slot that has some, by slot number
+        self.size = slots
+        self.slots = {}
+        self.lock = threading.Lock()
+        # Last tick whose slot was checked
+        self.checked = int(clock() // tick)
+
+    def schedule(self, session):
+        """ Expire the session timeout seconds from now, unless it is active again before """
+        session.expires = self.clock() + self.timeout
+        if session.scheduled is None:
+            self.add(session)
+
+    def cancel(self, session):
+        """ Stop timing a session out and take it out of its slot """
+        session.expires = None
+        if session.scheduled is not None:
+            with self.lock:
+                slot = self.slots.get(session.scheduled)
+                if slot is not None:
+                    slot.discard(session)
+                    if not slot:
+                        del self.slots[session.scheduled]
+                session.scheduled = None
+
+    def add(self, session):
+        with self.lock:
+            # Another thread may have put it in a slot meanwhile, or cancelled it
+            expires = session.expires
+            if session.scheduled is not None or expires is None:
+                return
+            # Never put a session in a slot already checked
+            tick = max(-int(-expires // self.tick), self.checked + 1)
+            slot = self.slots.get(tick % self.size)
+            if slot is None:
+                slot = self.slots[tick % self.size] = set()
+            slot.add(session)
+            session.scheduled = tick % self.size
+
+    def advance(self):
+        """ Refund the sessions whose deadline passed, returns them """
+        now = self.clock()
+        expired = []
+        with self.lock:
+            current = int(now // self.tick)
+            # Each slot holds every session due in it, so one turn of the wheel is enough after a long pause
+            first = max(self.checked + 1, current - self.size + 1)
+            due = []
+            if self.slots:
+                for tick in range(first, current + 1):
+                    due.extend(self.slots.pop(tick % self.size, ()))
+            for session in due:
+                session.scheduled = None
+            self.checked = current
+
+        for session in due:
+            if session.expires is None:
+                continue
+            if session.expires <= now:
+                session.expire()
+                expired.append(session)
+            else:
+                # Active again since it was scheduled, wait for the new deadline
+                self.add(session)
+        return expired
+
+
+class Sale_Session():
+    """ The item selected and the cash deposited by one customer
+
+    A session goes from idle to selecting once an item is chosen, to
+    depositing once cash is inserted, to dispensing while the item is sold,
+    and to refunding while its deposit is returned. It is idle again after
+    a sale or a refund. A session left selecting or depositing for the
+    candy machine's timeout is refunded and made idle. While a card or
+    voucher payment is authorized the session is authorizing and does not
+    time out.
+    """
+
+    # States of a session
+    IDLE = "idle"
+    SELECTING = "selecting"
+    DEPOSITING = "depositing"
+    AUTHORIZING = "authorizing"
+    DISPENSING = "dispensing"
+    REFUNDING = "refunding"
+
+    __slots__ = ("candy_machine", "_item", "_deposit", "state", "expires", "scheduled")
+
+    def __init__(self, candy_machine):
+        self.candy_machine = candy_machine
+        self.deposit = 0
+        self.item = next(iter(candy_machine.item_key))
+        self.state = Sale_Session.IDLE
+        # Deadline of the inactivity timeout, none when the session is idle
+        self.expires = None
+        # Slot of the timer wheel holding the session, none when it is in none
+        self.scheduled = None
+
+    # Item Getter
+    @property
+    def item(self):
+        return self._item
+
+    # Item Setter
+    @item.setter
+    def item(self, item):
+        # Ensures the item maps to the key
+        if not item or item not in self.candy_machine.item_key:
+            raise ValueError("Selected item is invalid.")
+        else:
+            self._item = item
+
+    # Deposit Getter
+    @property
+    def deposit(self):
+        return self._deposit
+
+    # Desposit Setter
+    @deposit.setter
+    def deposit(self, deposit):
+        # Ensures deposit is a non negative integer
+        if deposit < 0:
+            raise ValueError("Deposit must be positive.")
+        else:
+            self._deposit = deposit
+
+    def touch(self):
+        """ Restart the inactivity timeout, only a customer selecting or depositing cash times out """
+        if self.state != Sale_Session.SELECTING and self.state != Sale_Session.DEPOSITING:
+            return
+        timeouts = self.candy_machine.timeouts
+        if timeouts is not None:
+            timeouts.schedule(self)
+
+    def finish(self):
+        """ Make the session idle, it no longer times out """
+        self.state = Sale_Session.IDLE
+        timeouts = self.candy_machine.timeouts
+        if timeouts is not None:
+            timeouts.cancel(self)
+
+    def select(self, item):
+        """ Choose the item to buy, raise value error if the item is invalid """
+        self.item = item
+        if self.state == Sale_Session.IDLE:
+            self.state = Sale_Session.SELECTING
+        self.touch()
+
+    def add_deposit(self, new_deposit):
+        """ Add the cash inserted by the customer to the deposit, return false if it is invalid """
+        # Ensures the inserted deposit is an integer no machine could hold more than
+        new_deposit = parse_integer(new_deposit)
+        if new_deposit is None or self.deposit + new_deposit > MAX_DEPOSIT:
+            return False
+
+        # Ignore deposits that are not positive
+        if new_deposit > 0:
+            self.deposit += new_deposit
+            self.state = Sale_Session.DEPOSITING
+            self.touch()
+            self.candy_machine.notify("deposit", item=self.item, amount=new_deposit)
+        return True
+
+    def refund(self):
+        """ Return the whole deposit to the customer """
+        self.state = Sale_Session.REFUNDING
+        deposit = self.deposit
+        self.deposit = 0
+        self.finish()
+        if deposit:
+            self.candy_machine.notify("refund", item=self.item, amount=deposit)
+        return deposit
+
+    def expire(self):
+        """ Refund a session left inactive, called by the timer wheel """
+        return self.refund()
+
+    def purchase(self):
+        """ Buy the selected item with the current deposit """
+        self.state = Sale_Session.DISPENSING
+        result = self.candy_machine.dispense(self.item, self.deposit)
+
+        # Reset the deposit, the rest of it is returned as change
+        if result:
+            self.deposit = 0
+            self.finish()
+        # Wait for more cash, or for the customer to go back
+        else:
+            self.state = Sale_Session.DEPOSITING if self.deposit else Sale_Session.SELECTING
+        return result
+
+    def authorize(self):
+        """ Wait for a payment to be authorized, raise value error if cash was deposited """
+        # Cash and a payment would both pay for the item
+        if self.deposit != 0:
+            raise ValueError("Cannot pay by card while a deposit is pending.")
+        self.state = Sale_Session.AUTHORIZING
+        timeouts = self.candy_machine.timeouts
+        if timeouts is not None:
+            timeouts.cancel(self)
+
+    def pay(self, payment):
+        """ Buy the selected item with a payment, see Candy_Machine.sell_paid """
+        self.state = Sale_Session.DISPENSING
+        result = self.candy_machine.sell_paid(self.item, payment)
+        if result:
+            self.finish()
+        else:
+            self.state = Sale_Session.SELECTING
+            self.touch()
+        return result
+
+    def sell_product(self, new_deposit):
+        """ Sell the selected item, return a result that is true if purchase is successful """
+        sale_metrics = self.candy_machine.sale_metrics
+        if not sale_metrics.enabled:
+            return self.sell(new_deposit)
+
+        sale_metrics.untimed -= 1
+        if sale_metrics.untimed > 0:
+            result = self.sell(new_deposit)
+            sale_metrics.record(result)
+            return result
+
+        sale_metrics.untimed = TIME_SAMPLE
+        began = time.perf_counter()
+        result = self.sell(new_deposit)
+        sale_metrics.record(result, time.perf_counter() - began)
+        return result
+
+    def sell(self, new_deposit):
+        """ Sell the selected item without recording metrics """
+
+        # Ensure that the chosen item is not out of stock
+        dispenser = self.candy_machine.item_key[self.item]
+        if dispenser.get_count() <= 0:
+            return Sale_Result(Sale_Result.OUT_OF_STOCK, self.item, dispenser.get_product_cost(), self.deposit)
+
+        # Reject the inserted cash if it is not a number
+        if not self.add_deposit(new_deposit):
+            return Sale_Result(Sale_Result.INVALID_DEPOSIT, self.item, dispenser.get_product_cost(), self.deposit)
+
+        return self.purchase()
+
+
+class Candy_Machine():
+    """ Created in the app """
+    def __init__(self, catalog=None, session_timeout=60):
+        """ Initalize the components of candy machine """
+        self.cash_register = self.Cash_Register()
+
+        # Fill a dispenser for each slot in the catalog
+        self.dispensers = self.Dispenser_Table()
+        for slot in catalog or DEFAULT_CATALOG:
+            self.dispensers.add(**slot)
+
+        # Key mapping to access each items' dispenser
+        self.item_key = {dispenser.sku: dispenser for dispenser in self.dispensers}
+
+        # Refunds sessions left inactive, none when sessions never time out
+        self.timeouts = Timer_Wheel(session_timeout) if session_timeout else None
+
+        # Sale of the customer using the app
+        self.session = Sale_Session(self)
+
+        # Callbacks told about every change to the stocks and cash
+        self.listeners = []
+
+        # Where counters and timers go, nothing is recorded by default
+        self.metrics = Null_Sink()
+
+        # Pricing rules, set by attaching a Pricing, items sell at their cost without them
+        self.pricing = None
+
+    # Metrics Getter
+    @property
+    def metrics(self):
+        return self._metrics
+
+    # Metrics Setter
+    @metrics.setter
+    def metrics(self, sink):
+        self._metrics = sink
+        # Counters of the sale path, looked up once
+        self.sale_metrics = Sale_Metrics(sink)
+
+    def add_listener(self, listener):
+        """ Call listener(event, details) after every sale and admin edit """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """ Stop calling a listener """
+        self.listeners.remove(listener)
+
+    def notify(self, event, **details):
+        """ Tell every listener about a change, with the locks of the change still held so it is never seen untold """
+        for listener in self.listeners:
+            listener(event, details)
+
+    def lock_all(self):
+        """ Lock every dispenser in catalog order then the register, returns the ExitStack that releases them
+
+        While they are held every sale and admin edit is either not made or
+        already told to the listeners.
+        """
+        return self.lock_dispensers(self.item_key.values())
+
+    def lock_dispensers(self, dispensers):
+        """ Lock some dispensers then the register, returns the ExitStack that releases them
+
+        Dispensers may share a lock (see shared_state.py), so each lock is taken
+        once, in the order of the first dispenser of the catalog using it. Every
+        path taking more than one dispenser lock goes through here, so none of
+        them waits on another in a cycle.
+        """
+        wanted = {dispenser.lock for dispenser in dispensers}
+        stack = ExitStack()
+        for lock in self.dispensers.locks:
+            if not wanted:
+                break
+            if lock in wanted:
+                wanted.discard(lock)
+                stack.enter_context(lock)
+        stack.enter_context(self.cash_register.lock)
+        return stack
+
+    def state(self):
+        """ Returns the cash and the cost and stocks of each item """
+        return {"cash": self.cash_register.current_balance(),
+                "counts": self.cash_register.counts,
+                "electronic": self.cash_register.electronic,
+                "items": {item: [dispenser.cost, dispenser.get_count()] for item, dispenser in self.item_key.items()}}
+
+    def restore(self, state):
+        """ Set the cash and items back to a state returned by state() """
+        self.cash_register.cash_register(state["cash"])
+        if "counts" in state:
+            self.cash_register.counts = state["counts"]
+        self.cash_register.electronic = state.get("electronic", 0)
+        for item, (cost, number_of_items) in state["items"].items():
+            # Skip items that were taken out of the catalog
+            if item in self.item_key:
+                self.item_key[item].dispenser(cost, number_of_items)
+
+    def set_balance(self, cash):
+        """ Let the admin change the cash in the register """
+        with self.cash_register.lock:
+            self.cash_register.cash_register(cash)
+            self.notify("balance", cash=self.cash_register.current_balance())
+
+    def edit_item(self, item, cost, number_of_items):
+        """ Let the admin change the cost and stocks of an item """
+        dispenser = self.item_key[item]
+        # The register too, listeners may count the cash when told
+        with dispenser.lock, self.cash_register.lock:
+            dispenser.dispenser(cost, number_of_items)
+            self.notify("item", item=item, cost=dispenser.cost, number_of_items=dispenser.get_count())
+
+    def apply_config(self, items, cash=None):
+        """ Let the admin change many items and the cash at once, listeners are told once
+
+        items maps items to [cost, number of items], none keeps a value. The
+        values go through the same setters as single edits.
+        """
+        dispensers = [self.item_key[item] for item in items]
+        # In the same order as batches, so two admins or an admin and a batch never wait on each other
+        with self.lock_dispensers(dispensers):
+            for dispenser, (cost, number_of_items) in zip(dispensers, items.values()):
+                dispenser.dispenser(dispenser.cost if cost is None else cost,
+                                    dispenser.get_count() if number_of_items is None else number_of_items)
+            if cash is not None:
+                self.cash_register.cash_register(cash)
+
+            self.notify("config", items={item: [dispenser.cost, dispenser.get_count()] for item, dispenser in zip(items, dispensers)},
+                        cash=None if cash is None else self.cash_register.current_balance())
+
+    # Item Getter
+    @property
+    def item(self):
+        return self.session.item
+
+    # Item Setter
+    @item.setter
+    def item(self, item):
+        self.session.item = item
+
+    # Deposit Getter
+    @property
+    def deposit(self):
+        return self.session.deposit
+
+    # Desposit Setter
+    @deposit.setter
+    def deposit(self, deposit):
+        self.session.deposit = deposit
+
+    def open_session(self):
+        """ Start a sale for another customer, independent of the app's own sale """
+        return Sale_Session(self)
+
+    def update_prices(self):
+        """ Apply the pricing rules of the current hour, if the hour changed """
+        if self.pricing is not None:
+            self.pricing.refresh_if_due()
+
+    def expire_sessions(self):
+        """ Refund every session inactive for longer than the timeout, returns them """
+        if self.timeouts is None:
+            return []
+        return self.timeouts.advance()
+
+    def select(self, item):
+        """ Choose the item to buy, raise value error if the item is invalid """
+        self.session.select(item)
+
+    def add_deposit(self, new_deposit):
+        """ Add the cash inserted by the customer to the deposit, return false if it is invalid """
+        return self.session.add_deposit(new_deposit)
+
+    def refund(self):
+        """ Return the whole deposit to the customer """
+        return self.session.refund()
+
+    def purchase(self):
+        """ Buy the selected item with the current deposit """
+        return self.session.purchase()
+
+    def sell_product(self, new_deposit):
+        """ Sell the item selected by the customer, return a result that is true if purchase is successful """
+        return self.session.sell_product(new_deposit)
+
+    def dispense(self, item, deposit):
+        """ Sell an item if it is in stock and the deposit covers it
+
+        Only the item's dispenser is locked while its stock and price are
+        checked, so sales of different items only wait for each other while
+        the register takes the payment and the listeners are told.
+        """
+        self.update_prices()
+        dispenser = self.item_key[item]
+        with dispenser.lock:
+            cost = dispenser.get_product_cost()
+
+            # Ensure that the chosen item is not out of stock
+            if dispenser.get_count() <= 0:
+                return Sale_Result(Sale_Result.OUT_OF_STOCK, item, cost, deposit)
+
+            # Asks for more deposit if deposit is not enough to buy the item
+            if deposit < cost:
+                return Sale_Result(Sale_Result.INSUFFICIENT_DEPOSIT, item, cost, deposit)
+
+            with self.cash_register.lock:
+                # Register keeps the deposit and gives the change, refuse the sale if it has no change for it
+                change = self.cash_register.take_payment(deposit, cost)
+                if change is None:
+                    return Sale_Result(Sale_Result.NO_CHANGE, item, cost, deposit)
+
+                # Give the item if deposit is enough
+                dispenser.makeSale()
+
+                # Tell the listeners before another sale changes the cash, so the journal and the books never miss a sale they can see
+                self.notify("sale", item=item, cost=cost, deposit=deposit)
+        return Sale_Result(Sale_Result.SUCCESS, item, cost, deposit, change)
+
+    def sell_paid(self, item, payment):
+        """ Sell an item with a card or voucher payment, its amount is what was authorized
+
+        The price is settled into the register under the payment's reference,
+        so retrying the same payment sells nothing more and gives the same result.
+        """
+        if not payment.approved:
+            return Sale_Result(Sale_Result.DECLINED, item, payment.amount, 0)
+
+        self.update_prices()
+        dispenser = self.item_key[item]
+        with dispenser.lock:
+            # A retry of a payment that was already settled
+            settled = self.cash_register.settled.get(payment.reference)
+            if settled is not None:
+                return Sale_Result(Sale_Result.SUCCESS, item, settled, settled)
+
+            cost = dispenser.get_product_cost()
+            if dispenser.get_count() <= 0:
+                return Sale_Result(Sale_Result.OUT_OF_STOCK, item, cost, payment.amount)
+            # The price may have gone up while the payment was authorized
+            if payment.amount < cost:
+                return Sale_Result(Sale_Result.INSUFFICIENT_DEPOSIT, item, cost, payment.amount)
+
+            with self.cash_register.lock:
+                if not self.cash_register.settle(payment.reference, cost):
+                    settled = self.cash_register.settled[payment.reference]
+                    return Sale_Result(Sale_Result.SUCCESS, item, settled, settled)
+                dispenser.makeSale()
+
+                # Only the price is taken, the customer gets no change
+                self.notify("sale", item=item, cost=cost, deposit=cost, provider=payment.provider, reference=payment.reference)
+        return Sale_Result(Sale_Result.SUCCESS, item, cost, cost)
+
+    def process_batch(self, transactions):
+        """ Sell many (item, deposit) rows at once, return the result of each row
+
+        Each row gives the same result as selecting the item, calling sell_product
+        with the deposit and refunding the deposit if the sale failed. Stocks and
+        cash are counted in arrays and written to the components once at the end.
+        """
+        # Rows are independent, so a pending deposit would not belong to any of them
+        if self.deposit != 0:
+            raise ValueError("Cannot process a batch while a deposit is pending.")
+
+        # Number each item so its stock and cost can be kept in arrays
+        items = list(self.item_key)
+        slot_of = {item: slot for slot, item in enumerate(items)}
+
+        # Validate every item before anything is sold
+        try:
+            rows = [(slot_of[item], deposit) for item, deposit in transactions]
+        except KeyError as error:
+            raise ValueError(f"Selected item {error.args[0]!r} is invalid.") from None
+
+        self.update_prices()
+
+        # Hold every dispenser and the register so no other sale changes them during the batch
+        with self.lock_all():
+            results = self.settle_batch(items, rows)
+
+        if self.sale_metrics.enabled:
+            for result in results:
+                self.sale_metrics.record(result)
+        return results
+
+    def settle_batch(self, items, rows):
+        """ Sell the numbered rows of a batch, the dispensers must be locked """
+        stocks = array("q", (self.item_key[item].get_count() for item in items))
+        costs = array("q", (self.item_key[item].get_product_cost() for item in items))
+        sold = array("q", bytes(stocks.itemsize * len(items)))
+        revenue = array("q", bytes(stocks.itemsize * len(items)))
+        # Prices that depend on the stock change as the batch sells
+        pricing = self.pricing
+        rows_of = [self.item_key[item].index for item in items]
+        counts = self.cash_register.counts
+        credit = 0
+        results = []
+
+        for slot, deposit in rows:
+            item = items[slot]
+            cost = costs[slot]
+
+            # Ensure that the chosen item is not out of stock
+            if stocks[slot] <= 0:
+                results.append(Sale_Result(Sale_Result.OUT_OF_STOCK, item, cost, 0))
+                continue
+
+            # Reject the inserted cash if it is not a number, ignore it if it is not positive
+            deposit = parse_integer(deposit)
+            if deposit is None or deposit > MAX_DEPOSIT:
+                results.append(Sale_Result(Sale_Result.INVALID_DEPOSIT, item, cost, 0))
+                continue
+            deposit = max(deposit, 0)
+
+            if deposit < cost:
+                results.append(Sale_Result(Sale_Result.INSUFFICIENT_DEPOSIT, item, cost, deposit))
+                continue
+
+            # Refuse the sale if the register cannot give change for it
+            plan = self.cash_register.plan_payment(counts, deposit, cost)
+            if plan is None:
+                results.append(Sale_Result(Sale_Result.NO_CHANGE, item, cost, deposit))
+                continue
+            change, counts = plan
+
+            stocks[slot] -= 1
+            sold[slot] += 1
+            revenue[slot] += cost
+            credit += cost
+            if pricing is not None:
+                costs[slot] = pricing.price(rows_of[slot], stocks[slot])
+            results.append(Sale_Result(Sale_Result.SUCCESS, item, cost, deposit, change))
+
+        # Apply the whole batch to the dispensers and the register
+        for slot, count in enumerate(sold):
+            if count:
+                self.item_key[items[slot]].number_of_items = stocks[slot]
+        if credit:
+            self.cash_register.counts = counts
+            self.notify("batch", sold={items[slot]: count for slot, count in enumerate(sold) if count},
+                        revenue={items[slot]: revenue[slot] for slot, count in enumerate(sold) if count},
+                        credit=credit, counts=counts)
+
+        # Leave the last item selected, like selling each row one by one would
+        if rows:
+            self.item = items[rows[-1][0]]
+        return results
+
+
+    # Component (inner class) of Candy Machine
+    class Cash_Register():
+        """ Handles money """
+        __slots__ = ("lock", "_counts", "electronic", "settled")
+
+        def __init__(self, cash_on_hand=500):
+            # Makes updates from several threads happen one at a time
+            self.lock = threading.RLock()
+            self.cash_on_hand = cash_on_hand
+
+            # Money paid by card or voucher, it is owed by the payment providers rather than in the register
+            self.electronic = 0
+            # Amount settled under each recent payment reference, oldest first
+            self.settled = OrderedDict()
+
+        # Cash Getter
+        @property
+        def cash_on_hand(self):
+            return sum(count * denomination for count, denomination in zip(self._counts, DENOMINATIONS))
+
+        # Cash Setter
+        @cash_on_hand.setter
+        def cash_on_hand(self, cash_on_hand):
+            # Ensure cash is an integer
+            if isinstance(cash_on_hand, int):
+                # Change cash to default value if less than 0 (instructed in pdf)
+                if cash_on_hand < 0:
+                    cash_on_hand = 500
+                # Spread the cash over every denomination so there is change to give
+                self._counts = split_into_float(cash_on_hand)
+            else:
+                raise TypeError("Cash on Hand must be an integer")
+
+        # Counts Getter
+        @property
+        def counts(self):
+            return self._counts
+
+        # Counts Setter
+        @counts.setter
+        def counts(self, counts):
+            # Ensures there is a non negative count for each denomination
+            counts = tuple(counts)
+            if len(counts) != len(DENOMINATIONS) or not all(isinstance(count, int) and count >= 0 for count in counts):
+                raise ValueError("Counts must be a non negative integer for each denomination")
+            with self.lock:
+                self._counts = counts
+
+        # Prints out the cash by calling register itself
+        def __str__(self):
+            return f"Cash on hand is ${self.cash_on_hand:,.2f}"
+
+        def cash_register(self, cash_in=500):
+            """ Let candy machine modify cash on hand """
+            with self.lock:
+                self.cash_on_hand = cash_in
+
+        def current_balance(self):
+            """ Shows the current amount in the cash register """
+            return self.cash_on_hand
+
+        def accept_amount(self, amount_in):
+            """ Accepts the amount entered by the customer """
+            # Ensures the amount paid by the customer is valid
+            if isinstance(amount_in, int) and amount_in > 0:
+                # Add the payment of customer to current cash on hand
+                with self.lock:
+                    self._counts = tuple(count + added for count, added in zip(self._counts, split_into_bills(amount_in)))
+            else:
+                raise TypeError("Amount In must be non negative integer")
+
+        def plan_payment(self, counts, deposit, cost):
+            """ Change in bills for a deposit paying the cost, given the bills in the register
+
+            Returns the change and the bills left in the register after the sale,
+            or None if the exact change cannot be given.
+            """
+            # The deposited bills can be part of the change
+            counts = tuple(count + added for count, added in zip(counts, split_into_bills(deposit)))
+            change = change_for(deposit - cost, counts)
+            if change is None:
+                return None
+            return change, tuple(count - given for count, given in zip(counts, change))
+
+        def can_give_change(self, deposit, cost):
+            """ Returns true if a deposit paying the cost can get its change, cheap enough for every keystroke """
+            return deposit <= cost or self.plan_payment(self._counts, deposit, cost) is not None
+
+        def settle(self, reference, amount):
+            """ Take an amount paid by card or voucher, returns false if the reference was already settled """
+            with self.lock:
+                if reference in self.settled:
+                    return False
+                self.settled[reference] = amount
+                if len(self.settled) > SETTLED_REFERENCES:
+                    self.settled.popitem(last=False)
+                self.electronic += amount
+                return True
+
+        def take_payment(self, deposit, cost):
+            """ Keep the deposit and give back the change, returns the change or None if it cannot be given """
+            with self.lock:
+                plan = self.plan_payment(self._counts, deposit, cost)
+                if plan is None:
+                    return None
+                change, self._counts = plan
+                return change
+
+    # Component (inner class) of Candy Machine
+    class Dispenser_Table():
+        """ Holds every slot of the machine, one array per field so large machines stay compact """
+
+        def __init__(self):
+            self.slots = []
+            self.skus = []
+            self.names = []
+            self.costs = array("q")
+            # Price paid for each item, the cost with any pricing rules applied
+            self.prices = array("q")
+            self.counts = array("q")
+            self.locks = []
+
+            # Sets the prices from the pricing rules, none when prices are the costs
+            self.pricing = None
+
+            # Row of each slot ID and SKU
+            self.slot_index = {}
+            self.sku_index = {}
+
+        def __len__(self):
+            return len(self.skus)
+
+        def __iter__(self):
+            return (Candy_Machine.Dispenser(self, index) for index in range(len(self.skus)))
+
+        def add(self, sku, name=None, slot=None, cost=50, number_of_items=50):
+            """ Add a slot at the end of the table, returns its dispenser """
+            slot = slot or f"S{len(self.skus) + 1}"
+            if sku in self.sku_index or slot in self.slot_index:
+                raise ValueError(f"Slot {slot!r} or SKU {sku!r} is already in the catalog")
+
+            index = len(self.skus)
+            self.slots.append(slot)
+            self.skus.append(sku)
+            self.names.append(name or sku.title())
+            self.costs.append(0)
+            self.prices.append(0)
+            self.counts.append(0)
+            # Held while the stock is checked and changed, reentrant so makeSale can be called while holding it
+            self.locks.append(threading.RLock())
+            self.slot_index[slot] = index
+            self.sku_index[sku] = index
+
+            # Set the values through the dispenser so they are validated
+            dispenser = Candy_Machine.Dispenser(self, index)
+            dispenser.dispenser(cost, number_of_items)
+            return dispenser
+
+        def reprice(self, index):
+            """ Set the price of a row again, after its cost changed """
+            if self.pricing is None:
+                self.prices[index] = self.costs[index]
+            else:
+                self.pricing.compile_item(index)
+
+        def by_slot(self, slot):
+            """ Dispenser of a slot ID """
+            return Candy_Machine.Dispenser(self, self.slot_index[slot])
+
+        def by_sku(self, sku):
+            """ Dispenser of a SKU """
+            return Candy_Machine.Dispenser(self, self.sku_index[sku])
+
+    # Component (inner class) of Candy Machine
+    class Dispenser:
+        """ Handles product, a view of one row of the dispenser table """
+        __slots__ = ("table", "index")
+
+        def __init__(self, table, index):
+            self.table = table
+            self.index = index
+
+        # Read only details of the slot
+        @property
+        def slot(self):
+            return self.table.slots[self.index]
+
+        @property
+        def sku(self):
+            return self.table.skus[self.index]
+
+        @property
+        def name(self):
+            return self.table.names[self.index]
+
+        # Lock Getter
+        @property
+        def lock(self):
+            return self.table.locks[self.index]
+
+        # Lock Setter
+        @lock.setter
+        def lock(self, lock):
+            self.table.locks[self.index] = lock
+
+        # Cost Getter
+        @property
+        def cost(self):
+            return self.table.costs[self.index]
+
+        # Cost Setter
+        @cost.setter
+        def cost(self, cost):
+            # Ensures cost of an item is an integer
+            if isinstance(cost, int):
+                # If cost of an item is not positive, set to default 50 (instructed in pdf)
+                if cost <= 0:
+                    self.table.costs[self.index] = 50
+                else:
+                    self.table.costs[self.index] = cost
+                self.table.reprice(self.index)
+            else:
+                raise TypeError("Cost must be an integer")
+
+        # Getter
+        @property
+        def number_of_items(self):
+            return self.table.counts[self.index]
+
+        # Setter
+        @number_of_items.setter
+        def number_of_items(self, number_of_items):
+            # Ensures the number if items in stock is an integer
+            if isinstance(number_of_items, int):
+                # If the number of items in stock is negative, set to default 50 (instructed in pdf)
+                if number_of_items < 0:
+                    self.table.counts[self.index] = 50
+                else:
+                    self.table.counts[self.index] = number_of_items
+                # Prices may depend on the stock left
+                if self.table.pricing is not None:
+                    self.table.pricing.reprice(self.index)
+            else:
+                raise TypeError("Number of Items must be an integer")
+
+        # Prints out the cost and number of items by calling dispenser itself
+        def __str__(self):
+            return f"Cost is ${self.cost:,.2f} and Number of Items is {self.number_of_items}"
+
+        def dispenser(self, set_cost=50, set_no_of_items=50):
+            """ Let candy machine modify number of items and cost of an item """
+            with self.lock:
+                self.cost = set_cost
+                self.number_of_items = set_no_of_items
+
+        def get_count(self):
+            """ returns the number of items in stock if an an item """
+            return self.number_of_items
+
+        def get_product_cost(self):
+            """ returns the price of an item, its cost with any pricing rules applied """
+            return self.table.prices[self.index]
+
+        def makeSale(self):
+            """ Product sold, so reduce number of items in stock by 1 """
+            with self.lock:
+                self.number_of_items -= 1
@@ -0,0 +1,132 @@
+""" Simulate a fleet of candy machines over days of demand """
+import argparse
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from candy_machine import Candy_Machine, Sale_Result
+
+
+class Machine_Stats():
+    """ Totals of a simulated machine, or of a whole fleet when merged """
+    def __init__(self, machines=0):
+        self.machines = machines
+        self.sales = 0
+        self.revenue = 0
+        self.stockouts = 0
+        self.rejected = 0
+        self.change_given = 0
+
+    def __eq__(self, other):
+        if not isinstance(other, Machine_Stats):
+            return NotImplemented
+        return vars(self) == vars(other)
+
+    def __str__(self):
+        return (f"{self.machines:,} machines sold {self.sales:,} items for ${self.revenue:,.2f}, "
+                f"gave ${self.change_given:,.2f} in change, "
+                f"ran out of stock {self.stockouts:,} times and rejected {self.rejected:,} deposits")
+
+    def record(self, results):
+        """ Count the results of a batch of sales """
+        for result in results:
+            if result:
+                self.sales += 1
+                self.revenue += result.cost
+                self.change_given += result.change
+            elif result.status == Sale_Result.OUT_OF_STOCK:
+                self.stockouts += 1
+            else:
+                self.rejected += 1
+
+    def merge(self, other):
+        """ Add the totals of another machine or fleet """
+        for name, value in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+        return self
+
+
+def synthetic_demand(rng, candy_machine, customers):
+    """ Generate a day of (item, deposit) rows for a machine """
+    items = list(candy_machine.item_key)
+    rows = []
+    for _ in range(customers):
+        item = rng.choice(items)
+        cost = candy_machine.item_key[item].get_product_cost()
+        # Most customers pay enough, some pay exact change and a few come up short
+        rows.append((item, cost + rng.choice((-10, 0, 0, 10, 50))))
+    return rows
+
+
+def simulate_machine(machine_id, days, customers, seed=0, restock_every=7, recorded=None):
+    """ Run one machine over the given days, return its stats
+
+    Recorded demand is a list of days, each a list of (item, deposit) rows,
+    otherwise demand is generated from a random generator seeded by the fleet
+    seed and the machine id so results do not depend on how machines are sharded.
+    """
+    rng = random.Random(f"{seed}:{machine_id}")
+    candy_machine = Candy_Machine()
+    stats = Machine_Stats(machines=1)
+
+    for day in range(days):
+        # Refill every dispenser at the start of a restocking day
+        if restock_every and day and day % restock_every == 0:
+            for dispenser in candy_machine.item_key.values():
+                dispenser.number_of_items = 50
+
+        if recorded is not None:
+            rows = recorded[day] if day < len(recorded) else []
+        else:
+            rows = synthetic_demand(rng, candy_machine, customers)
+        stats.record(candy_machine.process_batch(rows))
+    return stats
+
+
+def simulate_shard(machine_ids, days, customers, seed, restock_every, recorded):
+    """ Run a group of machines in one worker process """
+    return [simulate_machine(machine_id, days, customers, seed, restock_every, recorded.get(machine_id))
+            for machine_id in machine_ids]
+
+
+def simulate_fleet(machines, days, customers, seed=0, restock_every=7, recorded=None, workers=None):
+    """ Simulate the fleet across worker processes, return the stats of each machine and the fleet """
+    recorded = recorded or {}
+    workers = workers or os.cpu_count() or 1
+
+    # Give each worker a few shards so slow machines do not hold up the whole pool
+    shard_count = min(machines, workers * 4) or 1
+    shards = [range(start, machines, shard_count) for start in range(shard_count)]
+
+    per_machine = [None] * machines
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(simulate_shard, list(shard), days, customers, seed, restock_every,
+                                   {machine_id: recorded[machine_id] for machine_id in shard if machine_id in recorded})
+                   for shard in shards]
+        for shard, future in zip(shards, futures):
+            for machine_id, stats in zip(shard, future.result()):
+                per_machine[machine_id] = stats
+
+    # Merge in machine order so the totals are the same for any number of workers
+    fleet = Machine_Stats()
+    for stats in per_machine:
+        fleet.merge(stats)
+    return per_machine, fleet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of candy machines.")
+    parser.add_argument("--machines", type=int, default=100, help="number of machines in the fleet")
+    parser.add_argument("--days", type=int, default=28, help="number of days to simulate")
+    parser.add_argument("--customers", type=int, default=200, help="customers per machine per day")
+    parser.add_argument("--restock-every", type=int, default=7, help="days between restocking, 0 to never restock")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic demand")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    _, fleet = simulate_fleet(args.machines, args.days, args.customers, args.seed, args.restock_every, workers=args.workers)
+    print(fleet)
+
+
+if __name__ == "__main__":
+    main()
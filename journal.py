@@ -0,0 +1,188 @@
+""" Crash-safe storage of a candy machine in an append-only journal with snapshots """
+import json
+import os
+import threading
+
+# Events that only record money moving through a sale or prices following the rules, replaying them changes nothing
+UNSAVED_EVENTS = {"deposit", "refund", "prices"}
+
+
+def apply_event(candy_machine, event, details):
+    """ Redo a journaled change on the candy machine """
+    if event == "sale":
+        candy_machine.item_key[details["item"]].makeSale()
+        # Card and voucher payments were settled under their reference rather than paid in bills
+        if "reference" in details:
+            candy_machine.cash_register.settle(details["reference"], details["cost"])
+        else:
+            candy_machine.cash_register.take_payment(details.get("deposit", details["cost"]), details["cost"])
+    elif event == "batch":
+        for item, count in details["sold"].items():
+            candy_machine.item_key[item].number_of_items -= count
+        if "counts" in details:
+            candy_machine.cash_register.counts = details["counts"]
+        else:
+            candy_machine.cash_register.accept_amount(details["credit"])
+    elif event == "balance":
+        candy_machine.cash_register.cash_register(details["cash"])
+    elif event == "item":
+        candy_machine.item_key[details["item"]].dispenser(details["cost"], details["number_of_items"])
+    elif event == "config":
+        for item, (cost, number_of_items) in details["items"].items():
+            candy_machine.item_key[item].dispenser(cost, number_of_items)
+        if details["cash"] is not None:
+            candy_machine.cash_register.cash_register(details["cash"])
+    else:
+        raise ValueError(f"Unknown journal event {event!r}")
+
+
+class Journal():
+    """ Saves every change of a candy machine so it survives restarts
+
+    Changes are appended to journal.log and flushed to disk in groups: once
+    group_commit records are waiting, or commit_interval seconds after the
+    first waiting record, whichever comes first. A group_commit of 1 syncs
+    every sale. Every snapshot_every records the whole state is written to
+    snapshot.json and the journal is emptied, so recovery only replays the
+    records since the last snapshot. Listeners are told with the locks of
+    the change held, so snapshots are taken on their own thread under every
+    lock of the candy machine, never holding a sale that is not journaled.
+    """
+    def __init__(self, directory, group_commit=64, commit_interval=0.05, snapshot_every=10000):
+        self.directory = directory
+        self.group_commit = group_commit
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+
+        self.journal_path = os.path.join(directory, "journal.log")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+
+        self.candy_machine = None
+        self.sequence = 0
+        self.since_snapshot = 0
+        self.pending = 0
+        self.timer = None
+        self.snapshotting = None
+        self.file = None
+        self.lock = threading.RLock()
+
+    def attach(self, candy_machine):
+        """ Restore the candy machine from disk then journal its changes """
+        os.makedirs(self.directory, exist_ok=True)
+        self.candy_machine = candy_machine
+        self.recover()
+        candy_machine.add_listener(self.record)
+
+    def recover(self):
+        """ Load the candy machine from disk then start a fresh snapshot, so a torn record is never followed by new ones """
+        self.load(self.candy_machine)
+        self.snapshot()
+
+    def load(self, candy_machine):
+        """ Load the last snapshot then replay the journal written after it, without writing anything
+
+        Safe on the directory of a running machine, e.g. for an audit, the
+        records it has not flushed yet are left out.
+        """
+        self.candy_machine = candy_machine
+        snapshot_sequence = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as file:
+                snapshot = json.load(file)
+            self.candy_machine.restore(snapshot["state"])
+            snapshot_sequence = snapshot["sequence"]
+        self.sequence = snapshot_sequence
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    # A record cut short by a crash is the end of the journal
+                    except ValueError:
+                        break
+                    # Skip records already in the snapshot (crash before the journal was emptied)
+                    if record["sequence"] <= snapshot_sequence:
+                        continue
+                    apply_event(self.candy_machine, record["event"], record["details"])
+                    self.sequence = record["sequence"]
+
+    def record(self, event, details):
+        """ Append a change to the journal, called by the candy machine """
+        if event in UNSAVED_EVENTS:
+            return
+        with self.lock:
+            self.sequence += 1
+            self.file.write(json.dumps({"sequence": self.sequence, "event": event, "details": details}) + "\n")
+            self.pending += 1
+            self.since_snapshot += 1
+
+            if self.pending >= self.group_commit:
+                self.sync()
+            elif self.timer is None and self.commit_interval:
+                self.timer = threading.Timer(self.commit_interval, self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+
+            # The sale's locks are held, taking the others here could deadlock with a batch
+            if self.since_snapshot >= self.snapshot_every and self.snapshotting is None:
+                self.snapshotting = threading.Thread(target=self.snapshot, name="journal-snapshot", daemon=True)
+                self.snapshotting.start()
+
+    def sync(self):
+        """ Flush the waiting records to disk """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.pending and self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.pending = 0
+
+    def snapshot(self):
+        """ Write the whole state to disk then empty the journal, the caller must hold none of the candy machine's locks """
+        with self.candy_machine.lock_all(), self.lock:
+            temporary_path = self.snapshot_path + ".tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump({"sequence": self.sequence, "state": self.candy_machine.state()}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.snapshot_path)
+            self.sync_directory()
+
+            # The snapshot has every record, so the journal can start over
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.journal_path, "w", encoding="utf-8")
+            self.pending = 0
+            self.since_snapshot = 0
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.snapshotting = None
+
+    def sync_directory(self):
+        """ Make renames in the directory durable """
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        descriptor = os.open(self.directory, os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def close(self):
+        """ Sync the journal and stop recording """
+        with self.lock:
+            if self.candy_machine is not None and self.record in self.candy_machine.listeners:
+                self.candy_machine.remove_listener(self.record)
+            snapshotting = self.snapshotting
+        # A snapshot under way reopens the journal, let it finish first
+        if snapshotting is not None:
+            snapshotting.join()
+        with self.lock:
+            self.sync()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,277 @@
+""" History of every sale, deposit, refund and admin edit, stored for fast time range queries
+
+Events are packed into fixed size binary records and appended to segment
+files of at most segment_size records. index.json keeps the time range and
+items of each segment, so a query only opens (memory maps) the segments it
+needs and binary searches them for the start of the range. The index is
+written whenever a segment or an item is added, segments it does not know
+of after a crash are found and scanned when the ledger is opened again.
+
+When the ledger starts recording it counts the cash and the stock of each
+item, so the history can be reconciled from a known state (see reconcile.py).
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Time, item number, event code, amount of money, number of items
+RECORD = struct.Struct("<dIBqi")
+
+# Event codes stored in the records
+EVENT_CODES = {"sale": 1, "deposit": 2, "refund": 3, "balance": 4, "item": 5, "count": 6, "payment": 7}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+# Item number of events that are not about an item (e.g. balance edits)
+NO_ITEM = 0xFFFFFFFF
+
+
+def records(event, details):
+    """ The (event, item, amount, number of items) records of a candy machine event """
+    if event == "sale":
+        # Sales paid by card or voucher put no cash in the register
+        yield "payment" if "reference" in details else "sale", details["item"], details["cost"], 1
+    elif event == "batch":
+        for item, count in details["sold"].items():
+            yield "sale", item, details["revenue"][item], count
+    elif event in ("deposit", "refund"):
+        yield event, details["item"], details["amount"], 0
+    elif event == "balance":
+        yield "balance", None, details["cash"], 0
+    elif event == "item":
+        yield "item", details["item"], details["cost"], details["number_of_items"]
+    elif event == "config":
+        for item, (cost, number_of_items) in details["items"].items():
+            yield "item", item, cost, number_of_items
+        if details["cash"] is not None:
+            yield "balance", None, details["cash"], 0
+
+
+def counts(candy_machine):
+    """ Count records of the cash and the stock of each item of a candy machine """
+    yield "count", None, candy_machine.cash_register.current_balance(), 0
+    for item, dispenser in candy_machine.item_key.items():
+        yield "count", item, 0, dispenser.get_count()
+
+
+class Ledger_Event():
+    """ One event read back from the ledger """
+    __slots__ = ("time", "item", "event", "amount", "count")
+
+    def __init__(self, time, item, event, amount, count):
+        self.time = time
+        self.item = item
+        self.event = event
+        self.amount = amount
+        self.count = count
+
+    def __repr__(self):
+        return f"Ledger_Event({self.time}, {self.item!r}, {self.event!r}, amount={self.amount}, count={self.count})"
+
+
+class Ledger():
+    """ Append-only, segmented event log of a candy machine """
+    def __init__(self, directory, segment_size=65536, clock=time.time):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.candy_machine = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.json")
+        self.items = []
+        self.item_numbers = {}
+        self.segments = []
+        self.load_index()
+
+        # Open the last segment to keep appending to it
+        if not self.segments or self.segments[-1]["count"] >= self.segment_size:
+            self.new_segment()
+        self.file = open(self.segment_path(self.segments[-1]), "ab")
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, segment["file"])
+
+    def load_index(self):
+        """ Read the index, then rescan the last segment and any segment the index missed """
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as file:
+                index = json.load(file)
+            self.items = index["items"]
+            self.segments = index["segments"]
+        self.item_numbers = {item: number for number, item in enumerate(self.items)}
+
+        # Segments started after the index was last written, e.g. the machine stopped without closing the ledger
+        known = {segment["file"] for segment in self.segments}
+        stale = self.segments[-1:]
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith("segment-") and name.endswith(".bin") and name not in known:
+                segment = {"file": name}
+                self.segments.append(segment)
+                stale.append(segment)
+
+        for segment in stale:
+            path = self.segment_path(segment)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            # Drop a record cut short by a crash
+            if size % RECORD.size:
+                with open(path, "r+b") as file:
+                    file.truncate(size - size % RECORD.size)
+            self.scan_segment(segment)
+
+    def scan_segment(self, segment):
+        """ Recompute the time range, items and count of a segment from its records """
+        segment.update(count=0, first=None, last=None, items=[])
+        items = set()
+        path = self.segment_path(segment)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as file:
+            data = file.read()
+        for when, item, _, _, _ in RECORD.iter_unpack(data):
+            if segment["first"] is None:
+                segment["first"] = when
+            segment["last"] = when
+            segment["count"] += 1
+            if item != NO_ITEM:
+                items.add(item)
+        segment["items"] = sorted(items)
+
+    def new_segment(self):
+        """ Start a new segment file, listed in the index before it is written to """
+        segment = {"file": f"segment-{len(self.segments):06d}.bin", "count": 0, "first": None, "last": None, "items": []}
+        self.segments.append(segment)
+        self.write_index()
+        return segment
+
+    def write_index(self):
+        """ Save the index of every segment """
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"items": self.items, "segments": self.segments}, file)
+        os.replace(temporary_path, self.index_path)
+
+    def item_number(self, item):
+        """ Number stored in the records for an item, given the first time it is seen """
+        if item is None:
+            return NO_ITEM
+        number = self.item_numbers.get(item)
+        if number is None:
+            number = self.item_numbers[item] = len(self.items)
+            self.items.append(item)
+            # Records are only readable with the names of their items, save the name before the first record
+            self.write_index()
+        return number
+
+    def attach(self, candy_machine):
+        """ Record the events of a candy machine, starting from a count of its cash and stocks """
+        self.candy_machine = candy_machine
+        for record in counts(candy_machine):
+            self.append(*record)
+        candy_machine.add_listener(self.record)
+
+    def record(self, event, details):
+        """ Turn a candy machine event into ledger records, called by the candy machine """
+        for record in records(event, details):
+            self.append(*record)
+
+    def append(self, event, item, amount, count, when=None):
+        """ Add a record at the end of the ledger """
+        with self.lock:
+            when = self.clock() if when is None else when
+            segment = self.segments[-1]
+            if segment["count"] >= self.segment_size:
+                self.seal()
+                segment = self.segments[-1]
+
+            number = self.item_number(item)
+            self.file.write(RECORD.pack(when, number, EVENT_CODES[event], amount, count))
+            if segment["first"] is None:
+                segment["first"] = when
+            segment["last"] = when
+            segment["count"] += 1
+            if number != NO_ITEM and number not in segment["items"]:
+                segment["items"].append(number)
+
+    def seal(self):
+        """ Close the full segment and start the next one, the lock must be held """
+        self.file.close()
+        self.segments[-1]["items"].sort()
+        self.new_segment()
+        self.file = open(self.segment_path(self.segments[-1]), "ab")
+
+    def flush(self):
+        """ Write buffered records and the index to disk """
+        with self.lock:
+            self.file.flush()
+            self.write_index()
+
+    def close(self):
+        """ Flush and stop recording """
+        if self.candy_machine is not None and self.record in self.candy_machine.listeners:
+            self.candy_machine.remove_listener(self.record)
+        self.flush()
+        with self.lock:
+            self.file.close()
+
+    def events(self, start=None, end=None, items=None, events=None):
+        """ Events with start <= time < end, optionally only of some items and event types
+
+        Segments outside the time range or without any of the items are not read.
+        """
+        self.file.flush()
+        numbers = None if items is None else {self.item_numbers[item] for item in items if item in self.item_numbers}
+        codes = None if events is None else {EVENT_CODES[event] for event in events}
+
+        for segment in list(self.segments):
+            if not segment["count"] or segment["first"] is None:
+                continue
+            if (start is not None and segment["last"] < start) or (end is not None and segment["first"] >= end):
+                continue
+            if numbers is not None and numbers.isdisjoint(segment["items"]):
+                continue
+            yield from self.read_segment(segment, start, end, numbers, codes)
+
+    def read_segment(self, segment, start, end, numbers, codes):
+        """ Events of one segment in the time range, found by binary search on the mapped file """
+        path = self.segment_path(segment)
+        size = os.path.getsize(path) // RECORD.size * RECORD.size
+        if not size:
+            return
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+            total = size // RECORD.size
+
+            def first_at_or_after(when):
+                low, high = 0, total
+                while low < high:
+                    middle = (low + high) // 2
+                    if RECORD.unpack_from(mapped, middle * RECORD.size)[0] < when:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return low
+
+            first = 0 if start is None else first_at_or_after(start)
+            last = total if end is None else first_at_or_after(end)
+            view = memoryview(mapped)[first * RECORD.size:last * RECORD.size]
+            try:
+                for when, number, code, amount, count in RECORD.iter_unpack(view):
+                    if numbers is not None and number not in numbers:
+                        continue
+                    if codes is not None and code not in codes:
+                        continue
+                    item = None if number == NO_ITEM else self.items[number]
+                    yield Ledger_Event(when, item, EVENT_NAMES[code], amount, count)
+            finally:
+                view.release()
+
+    def revenue_by_hour(self, start=None, end=None, items=None):
+        """ Revenue of each item in each hour, cash and card, as {(item, hour start time): revenue} """
+        revenue = {}
+        for event in self.events(start, end, items, events=("sale", "payment")):
+            key = (event.item, event.time - event.time % 3600)
+            revenue[key] = revenue.get(key, 0) + event.amount
+        return revenue
@@ -0,0 +1,205 @@
+""" Counters and timers of the candy machine, sent to a pluggable sink
+
+Null_Sink is the default and does nothing, Registry_Sink keeps the values in
+memory and Prometheus_File_Sink also writes them to a file in the Prometheus
+text format, for a node exporter textfile collector to pick up.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds of histogram buckets in seconds
+TIME_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# Upper bounds of the change given buckets in dollars
+CHANGE_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 500)
+
+
+class Null_Timer():
+    """ Timer that does nothing """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = Null_Timer()
+
+
+class Null_Sink():
+    """ Sink used when metrics are disabled, every call returns straight away """
+    enabled = False
+
+    def count(self, name, amount=1, **labels):
+        pass
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return NULL_TIMER
+
+    def add_collector(self, collect):
+        pass
+
+
+class Timer():
+    """ Context manager recording the time spent inside it """
+    def __init__(self, sink, name, labels):
+        self.sink = sink
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.sink.observe(self.name, time.perf_counter() - self.began, **self.labels)
+        return False
+
+
+class Counter():
+    """ Value that only goes up, the caller holds the lock that guards it """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+class Histogram():
+    """ Count of values in each bucket, with their sum, the caller holds the lock that guards it """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry_Sink():
+    """ Keeps the metrics in memory """
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.counters = {}
+        self.histograms = {}
+        # Called before the metrics are read, to count anything queued
+        self.collectors = []
+
+    def add_collector(self, collect):
+        """ Call collect() before the metrics are read """
+        self.collectors.append(collect)
+
+    def collect(self):
+        """ Let every collector count what it queued """
+        for collect in self.collectors:
+            collect()
+
+    def counter(self, name, **labels):
+        """ The counter of a name and labels, created the first time it is asked for """
+        key = (name, tuple(sorted(labels.items())))
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters.setdefault(key, Counter())
+        return counter
+
+    def histogram(self, name, buckets=TIME_BUCKETS, **labels):
+        """ The histogram of a name and labels, created the first time it is asked for """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def count(self, name, amount=1, **labels):
+        counter = self.counter(name, **labels)
+        with self.lock:
+            counter.value += amount
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        histogram = self.histogram(name, buckets, **labels)
+        with self.lock:
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def value(self, name, **labels):
+        """ Current value of a counter """
+        self.collect()
+        counter = self.counters.get((name, tuple(sorted(labels.items()))))
+        return counter.value if counter else 0
+
+    def to_prometheus(self):
+        """ The metrics in the Prometheus text format """
+        self.collect()
+        with self.lock:
+            counters = sorted((key, counter.value) for key, counter in self.counters.items())
+            histograms = sorted(((key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                                 for key, histogram in self.histograms.items()), key=lambda row: row[0])
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), buckets, counts, histogram_sum, histogram_count in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            total = 0
+            for bound, count in zip(buckets + ("+Inf",), counts):
+                total += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {total}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram_sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram_count}")
+        return "\n".join(lines) + "\n"
+
+
+class Prometheus_File_Sink(Registry_Sink):
+    """ Keeps the metrics in memory and writes them to a file at most every interval seconds """
+    def __init__(self, path, interval=10):
+        super().__init__()
+        self.path = path
+        self.interval = interval
+        self.written = time.monotonic()
+
+    def count(self, name, amount=1, **labels):
+        super().count(name, amount, **labels)
+        self.write_if_due()
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        super().observe(name, value, buckets, **labels)
+        self.write_if_due()
+
+    def write_if_due(self):
+        if time.monotonic() - self.written >= self.interval:
+            self.write()
+
+    def write(self):
+        """ Replace the file with the current metrics """
+        self.written = time.monotonic()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary_path, self.path)
+
+
+def format_labels(labels):
+    """ Labels as {name="value",...}, empty if there are none """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
@@ -0,0 +1,155 @@
+""" Card, NFC and voucher payments, authorized by pluggable providers off the UI thread
+
+A provider answers whether a payment is approved and may take as long as
+its backend needs: Payments runs it on a thread pool and hands back a
+future, which the app polls with after() so the window never freezes.
+Approved payments are settled into the cash register under their
+reference, retrying a payment never charges or sells twice.
+
+    payments = Payments(candy_machine, [load_provider("mock", latency=1.5, failure_rate=0.1)])
+    future = payments.authorize("mock", "candy", 50)
+    result = payments.settle(candy_machine.session, future.result())
+
+Providers outside this module subclass Payment_Provider, implementing at
+least authorize(), and are loaded as "package.module:Class_Name".
+"""
+import abc
+import importlib
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Payment():
+    """ A payment of an amount for an item, approved or declined by its provider """
+    __slots__ = ("reference", "provider", "item", "amount", "approved", "reason")
+
+    def __init__(self, reference, provider, item, amount):
+        self.reference = reference
+        self.provider = provider
+        self.item = item
+        self.amount = amount
+        self.approved = False
+        # Why the payment was declined
+        self.reason = None
+
+    def __repr__(self):
+        return f"Payment({self.reference!r}, {self.provider!r}, {self.item!r}, amount={self.amount}, approved={self.approved})"
+
+
+class Payment_Provider(abc.ABC):
+    """ Backend of a payment method, its methods may block, they never run on the UI thread """
+    name = "provider"
+
+    @abc.abstractmethod
+    def authorize(self, payment):
+        """ Approve or decline a payment by setting payment.approved and payment.reason
+
+        Authorizing the same reference again must give the same answer.
+        """
+        raise NotImplementedError
+
+    def void(self, payment):
+        """ Release an approved payment that was not settled, e.g. the item sold out meanwhile """
+
+
+class Mock_Provider(Payment_Provider):
+    """ Local stand-in for a card terminal, answering after a latency and declining a share of payments """
+    def __init__(self, name="mock", latency=0.5, failure_rate=0.1, seed=None, sleep=time.sleep):
+        if not 0 <= failure_rate <= 1:
+            raise ValueError("Failure rate must be between 0 and 1")
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        # Answer given to each reference, so retries get the same one
+        self.answers = {}
+        self.voided = 0
+
+    def authorize(self, payment):
+        self.sleep(self.latency)
+        with self.lock:
+            if payment.reference not in self.answers:
+                self.answers[payment.reference] = self.random.random() >= self.failure_rate
+            payment.approved = self.answers[payment.reference]
+        if not payment.approved:
+            payment.reason = "The card was declined."
+
+    def void(self, payment):
+        with self.lock:
+            self.voided += 1
+
+
+# Provider class of each built in name
+PROVIDERS = {"mock": Mock_Provider}
+
+
+def load_provider(spec, **options):
+    """ Create the provider named by a built in name or "package.module:Class_Name" """
+    if spec in PROVIDERS:
+        return PROVIDERS[spec](**options)
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown payment provider {spec!r}, use {', '.join(PROVIDERS)} or package.module:Class_Name")
+    try:
+        provider = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as error:
+        raise ValueError(f"Cannot load payment provider {spec!r}: {error}") from None
+    if not (isinstance(provider, type) and issubclass(provider, Payment_Provider)):
+        raise ValueError(f"Payment provider {spec!r} is not a Payment_Provider")
+    try:
+        return provider(**options)
+    except TypeError as error:
+        # Also raised for a provider that does not implement authorize
+        raise ValueError(f"Cannot create payment provider {spec!r}: {error}") from None
+
+
+class Payments():
+    """ Authorizes payments with their providers on a thread pool and settles the approved ones """
+    def __init__(self, candy_machine, providers, workers=4):
+        self.candy_machine = candy_machine
+        self.providers = {provider.name: provider for provider in providers}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="payment")
+
+    def authorize(self, provider, item, amount, reference=None):
+        """ Start authorizing a payment, returns a future of the payment
+
+        Give the reference of an earlier payment to retry it.
+        """
+        payment = Payment(reference or uuid.uuid4().hex, provider, item, amount)
+        return self.executor.submit(self.run_authorization, self.providers[provider], payment)
+
+    def run_authorization(self, provider, payment):
+        """ Ask the provider, a provider that fails declines the payment """
+        try:
+            provider.authorize(payment)
+        except Exception as error:
+            payment.approved = False
+            payment.reason = f"The payment could not be authorized: {error}"
+        return payment
+
+    def settle(self, session, payment):
+        """ Sell the session's item with a payment, an approved payment that cannot be settled is voided """
+        result = session.pay(payment)
+        if not result:
+            self.void(payment)
+        if self.candy_machine.sale_metrics.enabled:
+            self.candy_machine.sale_metrics.record(result)
+        return result
+
+    def void(self, payment):
+        """ Release an approved payment in the background """
+        if payment.approved:
+            self.executor.submit(self.providers[payment.provider].void, payment)
+
+    def abandon(self, future):
+        """ Forget a payment the customer walked away from, voiding it once it is approved """
+        future.add_done_callback(lambda done: self.void(done.result()))
+
+    def close(self):
+        """ Stop taking payments, authorizations under way are left to finish """
+        self.executor.shutdown(wait=False)
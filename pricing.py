@@ -0,0 +1,199 @@
+""" Rule based prices that change with the time of day, the stock left and happy hour bundles
+
+Rules are compiled into tables when they change: for each item, its price
+in each hour of the day and the price steps of its stock levels. The
+dispenser table keeps the effective price of each item in a column, which
+is only rewritten when the hour, the rules, the cost or the stock of an
+item changes, so reading a price on the sale path stays O(1).
+
+A rules file is a JSON list such as:
+
+    [{"type": "time", "start": 22, "end": 6, "percent": -20},
+     {"type": "stock", "below": 5, "percent": 10, "items": ["candy"]},
+     {"type": "bundle", "start": 16, "end": 18, "items": ["chip", "gum"], "percent": -25}]
+"""
+import json
+import threading
+import time
+
+HOURS_PER_DAY = 24
+SECONDS_PER_HOUR = 3600
+
+
+class Price_Rule():
+    """ Changes the price of some items (all when items is none) by a percent then an amount """
+    def __init__(self, percent=0, amount=0, items=None):
+        self.percent = percent
+        self.amount = amount
+        self.items = None if items is None else set(items)
+
+    def matches(self, item):
+        return self.items is None or item in self.items
+
+    def adjust(self, price):
+        """ The price once the rule is applied, never less than 1 """
+        return max(price * (100 + self.percent) // 100 + self.amount, 1)
+
+
+class Time_Of_Day_Rule(Price_Rule):
+    """ Applies from the start hour until the end hour, wrapping past midnight when the end is earlier """
+    def __init__(self, start, end, percent=0, amount=0, items=None):
+        super().__init__(percent, amount, items)
+        self.start = start
+        self.end = end
+
+    def active(self, hour):
+        if self.start <= self.end:
+            return self.start <= hour < self.end
+        return hour >= self.start or hour < self.end
+
+
+class Happy_Hour_Bundle(Time_Of_Day_Rule):
+    """ Discount on every item of a bundle during happy hour
+
+    Each sale is of a single item, so the bundle is priced as the same
+    discount on each of its items rather than as a price for the set.
+    """
+    def __init__(self, items, start, end, percent=0, amount=0):
+        super().__init__(start, end, percent, amount, items)
+
+
+class Stock_Level_Rule(Price_Rule):
+    """ Applies while fewer than below items are left """
+    def __init__(self, below, percent=0, amount=0, items=None):
+        super().__init__(percent, amount, items)
+        self.below = below
+
+
+# Rule class of each type in a rules file
+RULE_TYPES = {"time": Time_Of_Day_Rule, "bundle": Happy_Hour_Bundle, "stock": Stock_Level_Rule}
+
+
+def load_rules(path):
+    """ Read the rules of a JSON rules file """
+    with open(path, encoding="utf-8") as file:
+        rules = json.load(file)
+    try:
+        return [RULE_TYPES[rule.pop("type")](**rule) for rule in rules]
+    except (KeyError, TypeError) as error:
+        raise ValueError(f"Invalid pricing rule in {path}: {error}") from None
+
+
+class Pricing():
+    """ Keeps the price column of a candy machine's dispenser table up to date with the rules
+
+    utc_offset is the local time zone in seconds, taken from the computer
+    when not given.
+    """
+    def __init__(self, rules=(), utc_offset=None, clock=time.time):
+        self.rules = list(rules)
+        self.utc_offset = time.localtime().tm_gmtoff if utc_offset is None else utc_offset
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.candy_machine = None
+        self.table = None
+
+        # Compiled tables, one entry per row of the dispenser table
+        self.hour_prices = []
+        self.stock_rules = []
+        self.stock_steps = []
+        self.hour = None
+        # Time the hour changes, when every price is looked up again
+        self.next_change = 0
+
+    def attach(self, candy_machine):
+        """ Price the items of a candy machine """
+        self.candy_machine = candy_machine
+        self.table = candy_machine.dispensers
+        candy_machine.pricing = self
+        self.table.pricing = self
+        self.compile()
+
+    def detach(self):
+        """ Go back to the plain cost of each item """
+        self.table.pricing = None
+        self.candy_machine.pricing = None
+        for index in range(len(self.table)):
+            self.table.reprice(index)
+        self.candy_machine.notify("prices")
+
+    def set_rules(self, rules):
+        """ Replace the rules and compile them """
+        with self.lock:
+            self.rules = list(rules)
+            self.compile()
+
+    def compile(self):
+        """ Compile the tables of every item and set their prices """
+        with self.lock:
+            self.hour_prices = [None] * len(self.table)
+            self.stock_rules = [None] * len(self.table)
+            self.stock_steps = [None] * len(self.table)
+            self.set_hour()
+            for index in range(len(self.table)):
+                self.compile_item(index)
+        self.candy_machine.notify("prices")
+
+    def set_hour(self):
+        """ Find the current hour and when the next one starts """
+        now = self.clock() + self.utc_offset
+        self.hour = int(now // SECONDS_PER_HOUR) % HOURS_PER_DAY
+        self.next_change = (now // SECONDS_PER_HOUR + 1) * SECONDS_PER_HOUR - self.utc_offset
+
+    def compile_item(self, index):
+        """ Compile the price of an item in each hour and its stock steps, after its cost or the rules changed """
+        with self.lock:
+            # Rows added to the table after the rules were compiled
+            for tables in (self.hour_prices, self.stock_rules, self.stock_steps):
+                tables.extend([None] * (index + 1 - len(tables)))
+
+            item = self.table.skus[index]
+            cost = self.table.costs[index]
+            hour_prices = []
+            for hour in range(HOURS_PER_DAY):
+                price = cost
+                for rule in self.rules:
+                    if isinstance(rule, Time_Of_Day_Rule) and rule.active(hour) and rule.matches(item):
+                        price = rule.adjust(price)
+                hour_prices.append(price)
+            self.hour_prices[index] = hour_prices
+            self.stock_rules[index] = [rule for rule in self.rules if isinstance(rule, Stock_Level_Rule) and rule.matches(item)]
+            self.compile_steps(index)
+            self.reprice(index)
+
+    def compile_steps(self, index):
+        """ Price of an item below each stock limit in the current hour, as (limit, price) from the lowest limit """
+        price = self.hour_prices[index][self.hour]
+        steps = []
+        for below in sorted({rule.below for rule in self.stock_rules[index]}):
+            # Below a limit, every rule with that limit or a higher one applies, in the order they were given
+            step_price = price
+            for rule in self.stock_rules[index]:
+                if rule.below >= below:
+                    step_price = rule.adjust(step_price)
+            steps.append((below, step_price))
+        self.stock_steps[index] = steps
+
+    def price(self, index, stock):
+        """ Price of an item in the current hour with a given stock """
+        for below, price in self.stock_steps[index]:
+            if stock < below:
+                return price
+        return self.hour_prices[index][self.hour]
+
+    def reprice(self, index):
+        """ Set the price column of an item, after its stock changed """
+        self.table.prices[index] = self.price(index, self.table.counts[index])
+
+    def refresh_if_due(self):
+        """ Set every price again once the hour changed, cheap when it did not """
+        if self.clock() < self.next_change:
+            return
+        with self.lock:
+            if self.clock() < self.next_change:
+                return
+            self.set_hour()
+            for index in range(len(self.table)):
+                self.compile_steps(index)
+                self.reprice(index)
+        self.candy_machine.notify("prices")
@@ -0,0 +1,249 @@
+""" Reconcile the cash and stocks of a candy machine with its sales and admin edits
+
+The books start from a count of the cash and stocks, then every sale adds
+its price to the cash and takes its items out of the stock. Whenever the
+machine is counted again the count must match the books:
+
+    cash     the register holds a different amount than the books
+    stock    a dispenser holds a different number of items than the books
+    oversold an item was sold while the books say it was out of stock
+    balance edit  the admin set the cash to another amount than the books
+    stock edit    the admin set a stock lower than the books
+    clock    a record is older than the record before it
+
+Sales paid by card or voucher take items out of the stock but add no
+cash. Restocks are not reported. Each discrepancy is reported once, the books
+then follow the count or edit.
+
+A Reconciler keeps the books of a running machine and counts it after
+each event. verify() checks recorded events in one pass with constant
+memory, e.g. months of a ledger:
+
+    python reconcile.py ledger-dir --state state-dir --window 24
+"""
+import argparse
+import os
+import threading
+import time
+
+from candy_machine import Candy_Machine, load_catalog
+from journal import Journal
+from ledger import Ledger, counts, records
+
+# Admin edits, the admin meant them but they are still reported for the audit
+EDITS = {"balance edit", "stock edit"}
+
+# Events that never change the books: deposits and refunds stay in the customer's session and prices change no count
+SESSION_EVENTS = {"deposit", "refund", "prices"}
+
+
+class Discrepancy():
+    """ A difference between the books and the machine, actual - expected is what is missing or extra """
+    __slots__ = ("time", "kind", "item", "expected", "actual")
+
+    def __init__(self, time, kind, item, expected, actual):
+        self.time = time
+        self.kind = kind
+        self.item = item
+        self.expected = expected
+        self.actual = actual
+
+    @property
+    def difference(self):
+        return self.actual - self.expected
+
+    def describe(self):
+        """ The discrepancy in words, for the admin """
+        if self.kind == "clock":
+            return f"A record is {self.expected - self.actual:,.0f} seconds older than the one before it."
+        if self.item is None:
+            return f"{self.kind.capitalize()}: the cash is ${self.actual:,} where ${self.expected:,} was expected."
+        return f"{self.kind.capitalize()}: {self.actual:,} {self.item} left where {self.expected:,} were expected."
+
+    def __repr__(self):
+        return f"Discrepancy({self.time}, {self.kind!r}, {self.item!r}, expected={self.expected}, actual={self.actual})"
+
+
+class Books():
+    """ Cash and stocks expected from the events, unknown (none) until they are counted or set """
+    def __init__(self):
+        self.cash = None
+        self.stocks = {}
+        self.last_time = None
+
+    def apply(self, when, event, item, amount, count):
+        """ Apply one ledger record, returns the discrepancies it shows """
+        found = []
+        if self.last_time is not None and when < self.last_time:
+            found.append(Discrepancy(when, "clock", item, self.last_time, when))
+        else:
+            self.last_time = when
+
+        if event in ("sale", "payment"):
+            if event == "sale" and self.cash is not None:
+                self.cash += amount
+            stock = self.stocks.get(item)
+            if stock is not None:
+                if stock < count:
+                    found.append(Discrepancy(when, "oversold", item, stock, stock - count))
+                self.stocks[item] = stock - count
+
+        elif event == "balance":
+            if self.cash is not None and amount != self.cash:
+                found.append(Discrepancy(when, "balance edit", None, self.cash, amount))
+            self.cash = amount
+
+        elif event == "item":
+            stock = self.stocks.get(item)
+            if stock is not None and count < stock:
+                found.append(Discrepancy(when, "stock edit", item, stock, count))
+            self.stocks[item] = count
+
+        elif event == "count":
+            if item is None:
+                if self.cash is not None and amount != self.cash:
+                    found.append(Discrepancy(when, "cash", None, self.cash, amount))
+                self.cash = amount
+            else:
+                stock = self.stocks.get(item)
+                if stock is not None and count != stock:
+                    found.append(Discrepancy(when, "stock", item, stock, count))
+                self.stocks[item] = count
+        return found
+
+
+def verify(events, closing=None):
+    """ Check events read back from a ledger in one pass, yields the discrepancies as they are found
+
+    closing is a candy machine whose cash and stocks are compared with the
+    books once every event was applied.
+    """
+    books = Books()
+    when = 0
+    for event in events:
+        when = event.time
+        yield from books.apply(when, event.event, event.item, event.amount, event.count)
+    if closing is not None:
+        for record in counts(closing):
+            yield from books.apply(when, *record)
+
+
+def summarize(discrepancies, window=86400):
+    """ Number and total difference of the discrepancies of each item and kind in each time window
+
+    Returns {(window start time, item, kind): [number, total difference]},
+    only windows with discrepancies take memory.
+    """
+    summary = {}
+    for discrepancy in discrepancies:
+        key = (discrepancy.time - discrepancy.time % window, discrepancy.item, discrepancy.kind)
+        totals = summary.setdefault(key, [0, 0])
+        totals[0] += 1
+        totals[1] += discrepancy.difference
+    return summary
+
+
+class Reconciler():
+    """ Keeps the books of a candy machine and counts it after every sale and admin edit
+
+    Events arrive with the register locked, so the count never includes a
+    sale of another thread that the books are still waiting for.
+    """
+    def __init__(self, on_discrepancy=None, clock=time.time):
+        self.on_discrepancy = on_discrepancy
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.books = Books()
+        self.candy_machine = None
+        self.found = 0
+
+    def attach(self, candy_machine):
+        """ Start the books from the current cash and stocks, then follow every event """
+        self.candy_machine = candy_machine
+        # No sale can slip between the first count and the first event
+        with candy_machine.lock_all():
+            self.check()
+            candy_machine.add_listener(self.record)
+
+    def close(self):
+        """ Stop following the candy machine """
+        if self.record in self.candy_machine.listeners:
+            self.candy_machine.remove_listener(self.record)
+
+    def record(self, event, details):
+        """ Apply an event to the books then count what it changed, called by the candy machine """
+        if event in SESSION_EVENTS:
+            return
+        with self.lock:
+            now = self.clock()
+            found = []
+            touched = set()
+            for kind, item, amount, count in records(event, details):
+                found.extend(self.books.apply(now, kind, item, amount, count))
+                touched.add(item)
+            if touched:
+                found.extend(self.count(now, touched))
+        for discrepancy in found:
+            self.report(discrepancy)
+
+    def count(self, when, items):
+        """ Compare the cash and the stocks of some items with the books, the lock must be held """
+        found = self.books.apply(when, "count", None, self.candy_machine.cash_register.current_balance(), 0)
+        for item in items:
+            if item is not None:
+                found.extend(self.books.apply(when, "count", item, 0, self.candy_machine.item_key[item].get_count()))
+        return found
+
+    def check(self):
+        """ Count the cash and every stock, returns the discrepancies found """
+        with self.candy_machine.lock_all(), self.lock:
+            found = self.count(self.clock(), list(self.candy_machine.item_key))
+        for discrepancy in found:
+            self.report(discrepancy)
+        return found
+
+    def report(self, discrepancy):
+        self.found += 1
+        self.candy_machine.metrics.count("candy_discrepancies_total", kind=discrepancy.kind)
+        if self.on_discrepancy is not None:
+            self.on_discrepancy(discrepancy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile the cash and stocks of a candy machine with its ledger.")
+    parser.add_argument("ledger", metavar="DIRECTORY", help="ledger directory of the machine")
+    parser.add_argument("--state", metavar="DIRECTORY", help="state directory of the machine, its cash and stocks are compared at the end")
+    parser.add_argument("--catalog", metavar="FILE", help="JSON file listing the slots of the machine")
+    parser.add_argument("--window", type=float, default=24, metavar="HOURS", help="length of the time windows discrepancies are grouped in")
+    parser.add_argument("--edits", action="store_true", help="also report admin edits of the cash and stocks")
+    args = parser.parse_args()
+    if not os.path.isdir(args.ledger):
+        parser.error(f"{args.ledger} is not a ledger directory")
+
+    # The machine as the journal left it, to compare with the books at the end of the ledger, the machine may still be running so nothing is written
+    closing = None
+    if args.state:
+        if not os.path.isdir(args.state):
+            parser.error(f"{args.state} is not a state directory")
+        closing = Candy_Machine(load_catalog(args.catalog) if args.catalog else None)
+        Journal(args.state).load(closing)
+
+    ledger = Ledger(args.ledger)
+    try:
+        discrepancies = (discrepancy for discrepancy in verify(ledger.events(), closing)
+                         if args.edits or discrepancy.kind not in EDITS)
+        summary = summarize(discrepancies, args.window * 3600)
+    finally:
+        ledger.close()
+
+    if not summary:
+        print("The cash and stocks reconcile.")
+        return
+    print(f"{'window':<17}{'item':<12}{'kind':<14}{'number':>8}{'difference':>12}")
+    for (start, item, kind), (number, difference) in sorted(summary.items(), key=lambda entry: (entry[0][0], entry[0][1] or "", entry[0][2])):
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(start)):<17}{item or 'cash':<12}{kind:<14}{number:>8,}{difference:>+12,}")
+    parser.exit(1)
+
+
+if __name__ == "__main__":
+    main()
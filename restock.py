@@ -0,0 +1,288 @@
+""" Predict when each item of a candy machine runs out, and list what a restocking route should bring
+
+Each item keeps an exponentially weighted count of its sales, which gives
+its sales velocity, and one such count for each hour of the day, which
+gives how its sales spread over the day. Both are updated in O(1) on every
+sale, so history is never rescanned.
+
+    python restock.py --hours 48 machine-1.json machine-2.json > route.csv
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+HOURS_PER_DAY = 24
+SECONDS_PER_HOUR = 3600
+
+# Longest forecast, items selling slower than this are reported as never running out
+LONGEST_FORECAST = 30 * HOURS_PER_DAY
+
+
+class Item_Velocity():
+    """ Decaying sales counts of one item, overall and for each hour of the day """
+    __slots__ = ("first", "level", "updated", "hour_levels", "hour_updated")
+
+    def __init__(self):
+        # Time of the first sale, used to correct the counts while they warm up
+        self.first = None
+        self.level = 0.0
+        self.updated = 0.0
+        self.hour_levels = [0.0] * HOURS_PER_DAY
+        self.hour_updated = [0.0] * HOURS_PER_DAY
+
+    def to_json(self):
+        return {"first": self.first, "level": self.level, "updated": self.updated,
+                "hour_levels": self.hour_levels, "hour_updated": self.hour_updated}
+
+    @classmethod
+    def from_json(cls, data):
+        velocity = cls()
+        velocity.first = data["first"]
+        velocity.level = data["level"]
+        velocity.updated = data["updated"]
+        velocity.hour_levels = list(data["hour_levels"])
+        velocity.hour_updated = list(data["hour_updated"])
+        return velocity
+
+
+class Restock_Forecast():
+    """ Sales velocity and stockout forecasts of every item of a candy machine
+
+    velocity_half_life is how long, in hours, until a sale counts half as
+    much in the velocity, season_half_life the same for the spread of sales
+    over the day. utc_offset is the local time zone in seconds, taken from
+    the computer when not given.
+    """
+    def __init__(self, velocity_half_life=72, season_half_life=14 * HOURS_PER_DAY, utc_offset=None, clock=time.time):
+        self.velocity_scale = velocity_half_life * SECONDS_PER_HOUR / math.log(2)
+        self.season_scale = season_half_life * SECONDS_PER_HOUR / math.log(2)
+        self.utc_offset = time.localtime().tm_gmtoff if utc_offset is None else utc_offset
+        self.clock = clock
+        self.items = {}
+        self.candy_machine = None
+
+    def attach(self, candy_machine):
+        """ Count the sales of a candy machine """
+        self.candy_machine = candy_machine
+        candy_machine.add_listener(self.record)
+
+    def record(self, event, details):
+        """ Count the items sold by a sale or a batch, called by the candy machine """
+        if event == "sale":
+            self.add_sale(details["item"], 1)
+        elif event == "batch":
+            now = self.clock()
+            for item, count in details["sold"].items():
+                self.add_sale(item, count, now)
+
+    def hour_of_day(self, when):
+        """ Local hour of the day of a time """
+        return int((when + self.utc_offset) // SECONDS_PER_HOUR) % HOURS_PER_DAY
+
+    def add_sale(self, item, count=1, when=None):
+        """ Count sold items in the decaying counts of their item """
+        when = self.clock() if when is None else when
+        velocity = self.items.get(item)
+        if velocity is None:
+            velocity = self.items[item] = Item_Velocity()
+        if velocity.first is None:
+            velocity.first = when
+            velocity.updated = when
+
+        velocity.level = velocity.level * math.exp((velocity.updated - when) / self.velocity_scale) + count
+        velocity.updated = when
+
+        hour = self.hour_of_day(when)
+        velocity.hour_levels[hour] = velocity.hour_levels[hour] * math.exp((velocity.hour_updated[hour] - when) / self.season_scale) + count
+        velocity.hour_updated[hour] = when
+
+    def daily_sales(self, item, now=None):
+        """ Sales of an item per day at its current velocity """
+        velocity = self.items.get(item)
+        if velocity is None or velocity.first is None:
+            return 0.0
+        now = self.clock() if now is None else now
+        level = velocity.level * math.exp((velocity.updated - now) / self.velocity_scale)
+
+        # A count that started recently has not reached its steady level yet
+        warmed_up = 1 - math.exp((velocity.first - now) / self.velocity_scale)
+        if warmed_up <= 0:
+            return 0.0
+        return level / (self.velocity_scale * warmed_up) * SECONDS_PER_HOUR * HOURS_PER_DAY
+
+    def day_shape(self, item, now=None):
+        """ Share of an item's daily sales made in each hour of the day """
+        velocity = self.items.get(item)
+        if velocity is None:
+            return [1 / HOURS_PER_DAY] * HOURS_PER_DAY
+        now = self.clock() if now is None else now
+        levels = [level * math.exp((updated - now) / self.season_scale)
+                  for level, updated in zip(velocity.hour_levels, velocity.hour_updated)]
+        # One sale spread over the day keeps hours without sales from being predicted as empty
+        prior = 1 / HOURS_PER_DAY
+        total = sum(levels) + 1
+        return [(level + prior) / total for level in levels]
+
+    def hourly_sales(self, item, now):
+        """ Expected sales of an item in each hour of the day """
+        daily = self.daily_sales(item, now)
+        return [daily * share for share in self.day_shape(item, now)]
+
+    def walk_hours(self, now, hours):
+        """ (hour of the day, fraction of it) of each hour from now, the first one may be partial """
+        elapsed = (now + self.utc_offset) % SECONDS_PER_HOUR / SECONDS_PER_HOUR
+        hour = self.hour_of_day(now)
+        fraction = 1 - elapsed
+        while hours > 0:
+            fraction = min(fraction, hours)
+            yield hour, fraction
+            hours -= fraction
+            hour = (hour + 1) % HOURS_PER_DAY
+            fraction = 1
+
+    def expected_sales(self, item, hours, now=None):
+        """ Items expected to sell in the next hours """
+        now = self.clock() if now is None else now
+        hourly = self.hourly_sales(item, now)
+        return sum(hourly[hour] * fraction for hour, fraction in self.walk_hours(now, hours))
+
+    def hours_left(self, item, stock, now=None):
+        """ Hours until an item runs out at its current velocity, none if it will not within the longest forecast """
+        now = self.clock() if now is None else now
+        if stock <= 0:
+            return 0.0
+        hourly = self.hourly_sales(item, now)
+        if not any(hourly):
+            return None
+
+        passed = 0.0
+        daily = sum(hourly)
+        for hour, fraction in self.walk_hours(now, LONGEST_FORECAST):
+            sales = hourly[hour] * fraction
+            if sales >= stock:
+                return passed + fraction * stock / sales
+            stock -= sales
+            passed += fraction
+
+            # Skip the whole days before the last one, so the walk is never longer than two days
+            if fraction == 1 and stock > daily:
+                days = (stock - daily) // daily
+                if passed + days * HOURS_PER_DAY > LONGEST_FORECAST:
+                    return None
+                stock -= days * daily
+                passed += days * HOURS_PER_DAY
+        return None
+
+    def forecast(self, candy_machine=None, now=None):
+        """ {item: (stock, daily sales, hours left)} of every item of a candy machine """
+        candy_machine = candy_machine or self.candy_machine
+        now = self.clock() if now is None else now
+        return {item: (dispenser.get_count(), self.daily_sales(item, now), self.hours_left(item, dispenser.get_count(), now))
+                for item, dispenser in candy_machine.item_key.items()}
+
+    def describe(self, item, stock, now=None):
+        """ Forecast of an item for the admin screens """
+        now = self.clock() if now is None else now
+        daily = self.daily_sales(item, now)
+        hours = self.hours_left(item, stock, now)
+        if hours is None:
+            return f"Selling {daily:,.1f} a day, not expected to run out within {LONGEST_FORECAST // HOURS_PER_DAY} days."
+        if hours == 0:
+            return "Out of stock."
+        return f"Selling {daily:,.1f} a day, expected to run out in {format_hours(hours)}."
+
+    def to_json(self, candy_machine=None):
+        """ The counts, and the stocks of the candy machine, for a route's restock list """
+        candy_machine = candy_machine or self.candy_machine
+        data = {"saved": self.clock(), "utc_offset": self.utc_offset,
+                "velocity_scale": self.velocity_scale, "season_scale": self.season_scale,
+                "items": {item: velocity.to_json() for item, velocity in self.items.items()}}
+        if candy_machine is not None:
+            data["stocks"] = {item: dispenser.get_count() for item, dispenser in candy_machine.item_key.items()}
+        return data
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_json(), file)
+
+    def load(self, path):
+        """ Continue from counts saved by save(), returns the stocks saved with them and when they were saved """
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        self.velocity_scale = data["velocity_scale"]
+        self.season_scale = data["season_scale"]
+        self.utc_offset = data["utc_offset"]
+        self.items = {item: Item_Velocity.from_json(velocity) for item, velocity in data["items"].items()}
+        return data.get("stocks", {}), data["saved"]
+
+
+def format_hours(hours):
+    """ Hours as a short duration, e.g. 45 min, 7.5 hours or 3.2 days """
+    if hours < 1:
+        return f"{hours * 60:.0f} min"
+    if hours < 48:
+        return f"{hours:.1f} hours"
+    return f"{hours / HOURS_PER_DAY:.1f} days"
+
+
+def restock_list(machines, hours, safety=0.2, now=None):
+    """ Rows of what each machine of a route needs to last the given hours
+
+    machines is a list of (machine name, forecast, {item: stock}, time of
+    the stocks), the time may be none for stocks read now. Older stocks are
+    reduced by the sales expected since. An item is listed when it is
+    expected to run out within the hours from now, with enough to cover its
+    expected sales plus a safety share. Rows are sorted by machine then by
+    how soon the item runs out.
+    """
+    rows = []
+    for name, forecast, stocks, when in machines:
+        now = forecast.clock() if now is None else now
+        when = now if when is None else when
+        # Hours from the time of the stocks until now, the stocks kept selling meanwhile
+        hours_since = max(now - when, 0) / SECONDS_PER_HOUR
+        machine_rows = []
+        for item, stock in stocks.items():
+            hours_left = forecast.hours_left(item, stock, when)
+            if hours_left is None or hours_left - hours_since > hours:
+                continue
+            hours_left = max(hours_left - hours_since, 0)
+
+            # Expected stock now, and sales from now until the hours are up
+            sold_since = forecast.expected_sales(item, hours_since, when)
+            stock = max(round(stock - sold_since), 0)
+            needed = math.ceil((forecast.expected_sales(item, hours_since + hours, when) - sold_since) * (1 + safety))
+            machine_rows.append({"machine": name, "item": item, "stock": stock,
+                                 "hours_left": round(hours_left, 1), "restock": max(needed - stock, 1)})
+        rows.extend(sorted(machine_rows, key=lambda row: row["hours_left"]))
+    return rows
+
+
+def write_restock_list(file, rows):
+    """ Write restock rows as CSV """
+    writer = csv.DictWriter(file, fieldnames=["machine", "item", "stock", "hours_left", "restock"])
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List what a restocking route should bring, from forecasts saved by each machine.")
+    parser.add_argument("forecasts", nargs="+", metavar="FILE", help="forecast saved by a candy machine, named after the machine")
+    parser.add_argument("--hours", type=float, default=48, help="hours each machine should last after the visit")
+    parser.add_argument("--safety", type=float, default=0.2, help="extra share of the expected sales to bring")
+    args = parser.parse_args()
+
+    machines = []
+    for path in args.forecasts:
+        forecast = Restock_Forecast()
+        stocks, saved = forecast.load(path)
+        machines.append((os.path.splitext(os.path.basename(path))[0], forecast, stocks, saved))
+    write_restock_list(sys.stdout, restock_list(machines, args.hours, args.safety))
+
+
+if __name__ == "__main__":
+    main()
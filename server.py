@@ -0,0 +1,157 @@
+""" Serve a candy machine over TCP so terminals can check stocks and buy without the app
+
+Each request and response is one line of JSON. Requests on a connection may be
+sent without waiting for the previous response (pipelining), responses come
+back in the same order and carry the request "id" if one was given.
+
+    {"op": "stock"}
+    {"op": "buy", "item": "candy", "deposit": 60}
+"""
+import argparse
+import asyncio
+import json
+import threading
+
+from candy_machine import Candy_Machine
+
+
+def handle_request(candy_machine, request):
+    """ Answer a single request, returns the response """
+    op = request.get("op")
+    if op == "stock":
+        candy_machine.update_prices()
+        return {"items": {item: {"cost": dispenser.get_product_cost(), "count": dispenser.get_count()}
+                          for item, dispenser in candy_machine.item_key.items()}}
+
+    if op == "buy":
+        # Every remote purchase is its own sale, it never touches the app's deposit
+        item = request.get("item")
+        if not isinstance(item, str):
+            return {"error": "Item must be a string."}
+        session = candy_machine.open_session()
+        try:
+            session.select(item)
+        except ValueError as error:
+            return {"error": str(error)}
+        result = session.sell_product(request.get("deposit"))
+        session.refund()
+        return {"status": result.status, "item": result.item, "cost": result.cost,
+                "deposit": result.deposit, "change": result.change}
+
+    return {"error": f"Unknown op {op!r}"}
+
+
+class Candy_Server():
+    """ Asyncio TCP front end of a candy machine
+
+    Every expire_every seconds the sessions of customers who walked away
+    are refunded, pass none when an app already expires them.
+    """
+    def __init__(self, candy_machine, host="127.0.0.1", port=8765, expire_every=1):
+        self.candy_machine = candy_machine
+        self.host = host
+        self.port = port
+        self.expire_every = expire_every
+        self.server = None
+        self.loop = None
+        self.expiry = None
+
+    async def start(self):
+        """ Start listening, returns once the socket is bound """
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.serve_client, self.host, self.port, backlog=4096)
+        # Report the real port when asked for any free one
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.expire_every:
+            self.expiry = asyncio.create_task(self.expire_sessions())
+
+    async def expire_sessions(self):
+        """ Refund inactive sessions until the server stops """
+        while True:
+            await asyncio.sleep(self.expire_every)
+            self.candy_machine.expire_sessions()
+
+    async def serve_forever(self):
+        """ Start then serve until cancelled """
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def serve_client(self, reader, writer):
+        """ Answer the requests of one connection in order """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    response = handle_request(self.candy_machine, request)
+                    if "id" in request:
+                        response["id"] = request["id"]
+                except (ValueError, AttributeError):
+                    response = {"error": "Request must be a JSON object."}
+                except TypeError:
+                    # A field of the wrong type, the connection stays open for the next request
+                    response = {"error": "Request has a field of the wrong type."}
+                writer.write(json.dumps(response).encode() + b"\n")
+
+                # Only waits when the client stops reading, so pipelined requests keep flowing
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def start_in_thread(self):
+        """ Serve from a background thread so it can share a process with the app, returns once listening
+
+        Raises what stopped the server from starting, e.g. OSError when the port is in use.
+        """
+        ready = threading.Event()
+        failed = []
+
+        def run():
+            async def serve():
+                try:
+                    await self.start()
+                except Exception as error:
+                    # Raised in the caller's thread, this one just ends
+                    failed.append(error)
+                    return
+                finally:
+                    ready.set()
+                await self.serve_forever()
+            asyncio.run(serve())
+
+        thread = threading.Thread(target=run, name="candy-server", daemon=True)
+        thread.start()
+        ready.wait()
+        if failed:
+            raise failed[0]
+        return thread
+
+    def stop(self):
+        """ Stop a server started with start_in_thread """
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+            if self.expiry is not None:
+                self.loop.call_soon_threadsafe(self.expiry.cancel)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a candy machine over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = Candy_Server(Candy_Machine(), args.host, args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+""" Stocks and cash of one candy machine shared by many processes, so sales are not limited to one core
+
+The number of items of each dispenser and the bills in the register live
+in a multiprocessing.shared_memory block of 64 bit integers. Dispensers
+are guarded by a few striped process locks (dispenser i uses lock
+i % stripes) and the register by its own, the same locks the candy
+machine already takes around a sale, so processes never oversell. A
+striped lock is taken once, in the order of the first dispenser using it
+(see Candy_Machine.lock_dispensers).
+
+    shared = Shared_State.create(Candy_Machine(catalog))
+    # in each worker process, given shared.spec()
+    candy_machine = Candy_Machine(catalog)
+    worker_state = Shared_State.open(spec)
+    worker_state.share(candy_machine)
+
+Costs, listeners and metrics stay in each process, so journals and pricing
+rules that depend on the stock only see the sales of their own process.
+"""
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+from candy_machine import DENOMINATIONS, Candy_Machine
+
+ITEM_SIZE = array("q").itemsize
+
+
+class Shared_Cash_Register(Candy_Machine.Cash_Register):
+    """ Cash register whose bills are kept in shared memory, guarded by a process lock """
+    __slots__ = ("view", "offset")
+
+    def __init__(self, view, offset, lock):
+        # The bills are already in shared memory, so the usual starting cash is not set
+        self.lock = lock
+        self.view = view
+        self.offset = offset
+        # Card and voucher payments are settled by the process that took them
+        self.electronic = 0
+        self.settled = OrderedDict()
+
+    # Bills Getter
+    @property
+    def _counts(self):
+        return tuple(self.view[self.offset:self.offset + len(DENOMINATIONS)])
+
+    # Bills Setter
+    @_counts.setter
+    def _counts(self, counts):
+        self.view[self.offset:self.offset + len(DENOMINATIONS)] = array("q", counts)
+
+
+class Shared_State():
+    """ Shared memory block holding the stocks and register bills of a candy machine
+
+    Layout: the number of items of each dispenser, then the count of each
+    denomination in the register.
+    """
+    def __init__(self, memory, items, dispenser_locks, register_lock, owner):
+        self.memory = memory
+        self.items = items
+        self.dispenser_locks = dispenser_locks
+        self.register_lock = register_lock
+        self.owner = owner
+        self.view = memory.buf.cast("q")
+        self.counts = self.view[:items]
+
+    @classmethod
+    def create(cls, candy_machine, stripes=16):
+        """ New block filled from a candy machine, which then sells from it """
+        items = len(candy_machine.dispensers)
+        memory = shared_memory.SharedMemory(create=True, size=(items + len(DENOMINATIONS)) * ITEM_SIZE)
+        # Reentrant, the candy machine takes a dispenser lock again while selling and a batch takes every one
+        dispenser_locks = [multiprocessing.RLock() for _ in range(min(stripes, items) or 1)]
+        state = cls(memory, items, dispenser_locks, multiprocessing.RLock(), owner=True)
+
+        state.view[:items] = candy_machine.dispensers.counts
+        state.view[items:] = array("q", candy_machine.cash_register.counts)
+        state.share(candy_machine)
+        return state
+
+    def spec(self):
+        """ What another process needs to open the block, pass it when the process is started """
+        return {"name": self.memory.name, "items": self.items,
+                "dispenser_locks": self.dispenser_locks, "register_lock": self.register_lock}
+
+    @classmethod
+    def open(cls, spec):
+        """ Open a block made by create() in another process """
+        memory = shared_memory.SharedMemory(name=spec["name"])
+        return cls(memory, spec["items"], spec["dispenser_locks"], spec["register_lock"], owner=False)
+
+    def share(self, candy_machine):
+        """ Make a candy machine with the same catalog sell from the block """
+        table = candy_machine.dispensers
+        if len(table) != self.items:
+            raise ValueError("Candy machine must have the catalog the shared state was created from")
+
+        # The table's columns are indexed the same way, so the count column can be the shared one
+        table.counts = self.counts
+        table.locks = [self.dispenser_locks[index % len(self.dispenser_locks)] for index in range(self.items)]
+        candy_machine.cash_register = Shared_Cash_Register(self.view, self.items, self.register_lock)
+
+    def close(self):
+        """ Stop using the block, it is freed once its creator closes it, candy machines sharing it must not sell anymore """
+        self.counts.release()
+        self.view.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
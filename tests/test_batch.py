@@ -0,0 +1,89 @@
+""" A batch gives the results and leaves the state that selling its rows one by one does
+
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from candy_machine import MAX_DEPOSIT, Candy_Machine, Sale_Result
+from pricing import Pricing, Stock_Level_Rule
+
+
+def sell_each(candy_machine, rows):
+    """ Sell the rows one at a time the way the app does, returns the results """
+    results = []
+    for item, deposit in rows:
+        candy_machine.select(item)
+        results.append(candy_machine.sell_product(deposit))
+        candy_machine.refund()
+    return results
+
+
+class Batch_Tests(unittest.TestCase):
+    def machines(self, cash=500, stocks=None, rules=None):
+        """ Two machines in the same state, one to sell row by row and one to sell the batch """
+        pair = []
+        for _ in range(2):
+            candy_machine = Candy_Machine()
+            candy_machine.set_balance(cash)
+            for item, count in (stocks or {}).items():
+                candy_machine.edit_item(item, 50, count)
+            if rules:
+                Pricing(rules, utc_offset=0, clock=lambda: 0).attach(candy_machine)
+            pair.append(candy_machine)
+        return pair
+
+    def assert_same(self, rows, **options):
+        sequential, batched = self.machines(**options)
+        expected = sell_each(sequential, rows)
+        results = batched.process_batch(rows)
+        for row, (wanted, got) in enumerate(zip(expected, results)):
+            self.assertEqual(got, wanted, f"row {row}: {rows[row]!r}")
+        self.assertEqual(len(results), len(expected))
+        self.assertEqual(batched.state(), sequential.state())
+        self.assertEqual(batched.item, sequential.item)
+        return results
+
+    def test_stock_runs_out_mid_batch(self):
+        results = self.assert_same([("candy", 50)] * 5, stocks={"candy": 3})
+        self.assertEqual([result.status for result in results], [Sale_Result.SUCCESS] * 3 + [Sale_Result.OUT_OF_STOCK] * 2)
+
+    def test_no_change(self):
+        results = self.assert_same([("candy", 100), ("candy", 50), ("candy", 100)], cash=0)
+        self.assertIn(Sale_Result.NO_CHANGE, [result.status for result in results])
+
+    def test_invalid_and_negative_deposits(self):
+        results = self.assert_same([("gum", "x"), ("gum", None), ("gum", -5), ("gum", 2.5), ("gum", "60"), ("gum", " 70 ")])
+        self.assertEqual([result.status for result in results][:2], [Sale_Result.INVALID_DEPOSIT] * 2)
+
+    def test_deposits_over_the_limit(self):
+        results = self.assert_same([("chip", MAX_DEPOSIT + 1), ("chip", MAX_DEPOSIT), ("chip", str(MAX_DEPOSIT + 1))], cash=MAX_DEPOSIT * 2)
+        self.assertEqual([result.status for result in results], [Sale_Result.INVALID_DEPOSIT, Sale_Result.SUCCESS, Sale_Result.INVALID_DEPOSIT])
+
+    def test_stock_level_pricing(self):
+        # The price goes up while the batch sells the stock down
+        rules = [Stock_Level_Rule(below=4, percent=50, items=["cookie"])]
+        results = self.assert_same([("cookie", 100)] * 8, stocks={"cookie": 6}, rules=rules)
+        self.assertEqual(sorted({result.cost for result in results}), [50, 75])
+
+    def test_random_batches(self):
+        rng = random.Random(1)
+        deposits = [0, 10, 49, 50, 60, 75, 100, 137, 200, -5, "x", None, "70", MAX_DEPOSIT + 1]
+        rules = [Stock_Level_Rule(below=10, percent=20, items=["candy", "gum"])]
+        statuses = set()
+        for seed in range(20):
+            rows = [(rng.choice(["candy", "chip", "gum", "cookie"]), rng.choice(deposits)) for _ in range(300)]
+            results = self.assert_same(rows, cash=rng.choice([0, 60, 500]), stocks={"chip": rng.randrange(60)},
+                                       rules=rules if seed % 2 else None)
+            statuses.update(result.status for result in results)
+        self.assertEqual(statuses, {Sale_Result.SUCCESS, Sale_Result.OUT_OF_STOCK, Sale_Result.INVALID_DEPOSIT,
+                                    Sale_Result.INSUFFICIENT_DEPOSIT, Sale_Result.NO_CHANGE})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+""" Concurrent sales lose no update, sell nothing twice and keep the journal and the books in step
+
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from candy_machine import Candy_Machine
+from journal import Journal
+from reconcile import Reconciler
+
+THREADS = 8
+SALES = 1500
+# One round misses a race now and then, a few make a missed race unlikely
+ROUNDS = 4
+
+
+def use_global_lock(candy_machine):
+    """ Make every dispenser and the register share one lock """
+    lock = threading.RLock()
+    candy_machine.cash_register.lock = lock
+    for dispenser in candy_machine.item_key.values():
+        dispenser.lock = lock
+
+
+def sell_from_threads(candy_machine, threads=THREADS, sales=SALES):
+    """ Sell from many threads at once, two threads per item, returns the sales made by each thread """
+    items = list(candy_machine.item_key)
+    sold = [0] * threads
+    start = threading.Barrier(threads)
+
+    def customer(number):
+        session = candy_machine.open_session()
+        session.select(items[number % len(items)])
+        start.wait()
+        for _ in range(sales):
+            if session.sell_product(50):
+                sold[number] += 1
+
+    workers = [threading.Thread(target=customer, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sold
+
+
+class Concurrency_Tests(unittest.TestCase):
+    def setUp(self):
+        # Switch threads often so sales interleave inside the locked regions
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+    def machine(self, stock):
+        candy_machine = Candy_Machine()
+        for dispenser in candy_machine.item_key.values():
+            dispenser.number_of_items = stock
+        return candy_machine
+
+    def assert_no_lost_updates(self, candy_machine, sold, stock):
+        total_sold = sum(sold)
+        dispensers = candy_machine.item_key.values()
+        self.assertTrue(all(dispenser.get_count() >= 0 for dispenser in dispensers), "item oversold")
+        self.assertEqual(sum(dispenser.get_count() for dispenser in dispensers) + total_sold, stock * len(dispensers))
+        self.assertEqual(candy_machine.cash_register.current_balance(), 500 + 50 * total_sold)
+
+    def test_threads_race_for_the_last_items(self):
+        # Far fewer items than attempts
+        stock = THREADS * SALES // 8
+        for global_lock in (False, True):
+            for round in range(ROUNDS):
+                with self.subTest(global_lock=global_lock, round=round):
+                    candy_machine = self.machine(stock)
+                    if global_lock:
+                        use_global_lock(candy_machine)
+                    sold = sell_from_threads(candy_machine)
+                    self.assert_no_lost_updates(candy_machine, sold, stock)
+                    self.assertEqual(sum(sold), stock * len(candy_machine.item_key))
+
+    def test_journal_and_books_follow_concurrent_sales(self):
+        stock = THREADS * SALES
+        with tempfile.TemporaryDirectory() as directory:
+            candy_machine = self.machine(stock)
+            discrepancies = []
+            journal = Journal(directory, snapshot_every=500)
+            journal.attach(candy_machine)
+            reconciler = Reconciler(discrepancies.append)
+            reconciler.attach(candy_machine)
+
+            sold = sell_from_threads(candy_machine)
+            journal.close()
+            reconciler.close()
+
+            self.assert_no_lost_updates(candy_machine, sold, stock)
+            self.assertEqual(discrepancies, [])
+            recovered = Candy_Machine()
+            Journal(directory).load(recovered)
+            self.assertEqual(recovered.state(), candy_machine.state())
+
+
+if __name__ == "__main__":
+    unittest.main()
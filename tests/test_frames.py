@@ -0,0 +1,87 @@
+""" Frames are built once and refreshed in place, buying never adds widgets
+
+Needs a display, run under Xvfb (e.g. xvfb-run) on headless machines, the
+tests are skipped when tk cannot open a window.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+import sys
+import tkinter
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_app_module():
+    """ Import the app, its file name is not a valid module name """
+    spec = importlib.util.spec_from_file_location("candy_machine_app", os.path.join(ROOT, "candy-machine.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def count_widgets(widget):
+    """ Number of widgets under a widget, itself included """
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class Frame_Tests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The app imports without a display, only a missing display skips, an app that fails to import or build fails
+        cls.app_module = load_app_module()
+        try:
+            tkinter.Tk().destroy()
+        except tkinter.TclError as error:
+            raise unittest.SkipTest(f"tk cannot open a window: {error}")
+        cls.app = cls.app_module.App()
+        cls.app.withdraw()
+        for dispenser in cls.app.candy_machine.item_key.values():
+            dispenser.number_of_items = 10 ** 9
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.destroy()
+
+    def buy(self, item, deposit):
+        self.app.controller("selection", item=item)
+        self.app.frame(self.app_module.Buy_Page).buy_entry.insert(0, deposit)
+        self.app.controller("buy", "buy")
+
+    def test_buying_keeps_the_widget_count(self):
+        # The first purchase builds the buy page
+        self.buy("candy", "60")
+        self.app.update()
+        before = count_widgets(self.app)
+
+        items = list(self.app.candy_machine.item_key)
+        for number in range(10000):
+            self.buy(items[number % len(items)], "60" if number % 3 else "20")
+            if number % 500 == 0:
+                self.app.update()
+        self.app.update()
+
+        self.assertEqual(count_widgets(self.app), before)
+
+    def test_admin_edits_keep_the_widget_count(self):
+        self.app.controller("admin", item="candy")
+        self.app.update()
+        before = count_widgets(self.app)
+
+        edit_item = self.app.frame(self.app_module.Edit_Item)
+        for number in range(1000):
+            edit_item.price_entry.delete(0, "end")
+            edit_item.price_entry.insert(0, str(50 + number % 2))
+            self.app.controller("edit_item", "save")
+            if number % 100 == 0:
+                self.app.update()
+        self.app.update()
+
+        self.assertEqual(count_widgets(self.app), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+""" Parsing and checking of the amounts entered in the app, sent to the server or read from files
+
+Every path that takes a deposit, price, stock or balance uses the same
+precompiled patterns, so an amount valid in one place is valid in all of
+them and invalid input is found without raising and catching exceptions.
+
+    parse_integer(" 60 ")        # 60
+    parse_integer("6O")          # None
+    accepts_amount("6")          # True, the entry box takes the keystroke
+"""
+import math
+import re
+
+# Text int() turns into an integer: digits with an optional sign, underscores between digits and whitespace around
+INTEGER_TEXT = re.compile(r"\s*[+-]?\d+(?:_\d+)*\s*")
+
+# What an entry box may hold while it is typed in, an empty box is allowed so it can be cleared
+AMOUNT_KEYS = re.compile(r"\d*")
+SIGNED_AMOUNT_KEYS = re.compile(r"-?\d*")
+
+
+def parse_integer(value, strict=False):
+    """ The integer a value holds, none when it holds none
+
+    Numbers are truncated the way int() does it, unless strict, then only
+    integers and integer text are taken, as the setters require.
+    """
+    # Fast path, amounts are integers when they do not come from text
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        # int() refuses text with more digits than sys.get_int_max_str_digits(), it is no amount either
+        try:
+            # Plain digits, as typed in the app, skip the pattern
+            if value.isdecimal():
+                return int(value)
+            return int(value) if INTEGER_TEXT.fullmatch(value) else None
+        except ValueError:
+            return None
+    if strict:
+        return None
+    if isinstance(value, int) or (isinstance(value, float) and math.isfinite(value)):
+        return int(value)
+    return None
+
+
+def accepts_amount(text):
+    """ Whether an entry box may hold this text, as a Tk validatecommand given %P """
+    return AMOUNT_KEYS.fullmatch(text) is not None
+
+
+def accepts_signed_amount(text):
+    """ Whether an entry box of the admin pages may hold this text, negative values are set to the default """
+    return SIGNED_AMOUNT_KEYS.fullmatch(text) is not None